@@ -37,6 +37,7 @@ class AppSettings:
         self._use_vcut = False
         self._use_jlc = False
         self._merge_error = 0.0
+        self._use_step_repeat = False
 
         self.default()
 
@@ -50,8 +51,10 @@ class AppSettings:
         self._use_vcut = PCB_PANEL_USE_VCUT
         self._use_jlc = PCB_PANEL_USE_JLC
         self._merge_error = PCB_PANEL_MERGE_ERROR
+        self._use_step_repeat = PCB_PANEL_USE_STEP_REPEAT
 
-    def set(self, gap, rail, bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error):
+    def set(self, gap, rail, bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error,
+            use_step_repeat):
         self._gap = clamp(1.0, gap, 10.0)
         self._rail = clamp(5, rail, 20.0)
         self._bites_count = int(clamp(1, bites_count, 10))
@@ -61,6 +64,7 @@ class AppSettings:
         self._use_vcut = use_vcut
         self._use_jlc = use_jlc
         self._merge_error = clamp(0.0, merge_error, 1.0)
+        self._use_step_repeat = use_step_repeat
 
     @property
     def rail(self):
@@ -98,5 +102,9 @@ class AppSettings:
     def merge_error(self):
         return float(self._merge_error)
 
+    @property
+    def use_step_repeat(self):
+        return self._use_step_repeat
+
 
 AppSettings = AppSettings()
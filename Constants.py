@@ -21,8 +21,7 @@
 # THE SOFTWARE.
 
 
-from typing import Final
-from kivy.graphics import Color
+from typing import Final, NamedTuple
 from posixpath import join
 
 
@@ -54,6 +53,8 @@ FIT_SCALE: Final                = 0.9
 
 PCB_PANEL_USE_VCUT: Final       = True
 PCB_PANEL_USE_JLC: Final        = False
+# write the Pcb boards once, inside a Gerber step and repeat (%SR%) block, when they form a regular grid
+PCB_PANEL_USE_STEP_REPEAT: Final = False
 
 PCB_PANEL_GAP_MM: Final         = 3.0
 
@@ -79,6 +80,7 @@ OSHPARK_PCB_BITES_HOLE_RADIUS_MM: Final = 0.254
 OSHPARK_PCB_BITES_HOLE_SPACE_MM: Final  = 0.508
 OSHPARK_PCB_PANEL_BITES_SIZE_MM: Final  = (PCB_BITES_ARC_MM+2.54+PCB_BITES_ARC_MM)
 OSHPARK_PCB_PANEL_VCUT: Final           = False
+OSHPARK_PCB_PANEL_STEP_REPEAT: Final    = False
 
 # JLC PCB (TODO need verified values)
 JLC_PCB_PANEL_RAIL_HEIGHT_MM: Final = PCB_PANEL_RAIL_HEIGHT_MM
@@ -87,6 +89,7 @@ JLC_PCB_BITES_HOLE_RADIUS_MM: Final = PCB_BITES_HOLE_RADIUS_MM
 JLC_PCB_BITES_HOLE_SPACE_MM: Final  = PCB_BITES_HOLE_SPACE_MM
 JLC_PCB_PANEL_BITES_SIZE_MM: Final  = (PCB_BITES_ARC_MM+2.0+PCB_BITES_ARC_MM)
 JLC_PCB_PANEL_VCUT: Final           = True
+JLC_PCB_PANEL_STEP_REPEAT: Final    = False
 
 # PCB Way (TODO need verified values)
 PCBWAY_PCB_PANEL_RAIL_HEIGHT_MM: Final = PCB_PANEL_RAIL_HEIGHT_MM
@@ -95,27 +98,54 @@ PCBWAY_PCB_BITES_HOLE_RADIUS_MM: Final = PCB_BITES_HOLE_RADIUS_MM
 PCBWAY_PCB_BITES_HOLE_SPACE_MM: Final  = PCB_BITES_HOLE_SPACE_MM
 PCBWAY_PCB_PANEL_BITES_SIZE_MM: Final  = (PCB_BITES_ARC_MM+2.0+PCB_BITES_ARC_MM)
 PCBWAY_PCB_PANEL_VCUT: Final           = True
+PCBWAY_PCB_PANEL_STEP_REPEAT: Final    = False
 
 # in mm
 PCB_PANEL_MERGE_ERROR: Final    = 0.15
 
+# number of worker processes used to export the panel layers (1 exports them one after another)
+PCB_PANEL_EXPORT_WORKERS: Final = 4
 
-GRID_BACKGROUND_COLOR: Final    = Color(0.95, 0.95, 0.95, 1.0)
-GRID_MAJOR_COLOR: Final         = Color(0.50, 0.50, 0.50, 1.0)
-GRID_MINOR_COLOR: Final         = Color(0.80, 0.80, 0.80, 1.0)
-
-PCB_MASK_COLOR: Final           = Color(0.15, 0.35, 0.15, 1.00)
-PCB_OUTLINE_COLOR: Final        = Color(0.00, 0.00, 0.00, 1.00)
-PCB_TOP_PASTE_COLOR: Final      = Color(0.55, 0.55, 0.55, 1.00)
-PCB_TOP_SILK_COLOR: Final       = Color(0.95, 0.95, 0.95, 1.00)
-PCB_TOP_MASK_COLOR: Final       = Color(0.75, 0.65, 0.00, 1.00)
-PCB_TOP_TRACES_COLOR: Final     = Color(0.00, 0.50, 0.00, 0.50)
-PCB_BOTTOM_TRACES_COLOR: Final  = Color(0.00, 0.50, 0.00, 0.50)
-PCB_BOTTOM_MASK_COLOR: Final    = Color(0.75, 0.65, 0.00, 1.00)
-PCB_BOTTOM_SILK_COLOR: Final    = Color(0.95, 0.95, 0.95, 1.00)
-PCB_BOTTOM_PASTE_COLOR: Final   = Color(0.55, 0.55, 0.55, 1.00)
-PCB_DRILL_NPTH_COLOR: Final     = Color(0.12, 0.12, 0.12, 0.80)
-PCB_DRILL_PTH_COLOR: Final      = Color(0.30, 0.15, 0.00, 0.50)
-
-PCB_BITE_GOOD_COLOR: Final      = Color(0.25, 0.85, 0.25, 0.75)
-PCB_BITE_BAD_COLOR: Final       = Color(0.85, 0.25, 0.25, 0.75)
+# number of worker processes used to parse the PCB files (1 parses them one after another)
+PCB_LOAD_WORKERS: Final = 4
+
+# number of worker processes used to render the PCB layers (1 renders them one after another),
+# leave at 1 until the parallel rendering is timed against the serial one
+PCB_RENDER_WORKERS: Final = 1
+
+# write the rendered PCB layers into .png files, the textures are loaded from them
+PCB_WRITE_LAYER_FILES: Final = True
+
+# create the textures from the rendered layers in memory instead of loading them from the .png files,
+# leave at False until the in memory textures are verified against the .png ones (orientation and channel order)
+PCB_LOAD_LAYER_RASTERS: Final = False
+
+
+# plain (r, g, b, a) values, so that the constants can be used without kivy (ex. by do_panelize.py),
+# the kivy Color instructions are created from them when painting
+class RGBA(NamedTuple):
+    r: float
+    g: float
+    b: float
+    a: float
+
+
+GRID_BACKGROUND_COLOR: Final    = RGBA(0.95, 0.95, 0.95, 1.0)
+GRID_MAJOR_COLOR: Final         = RGBA(0.50, 0.50, 0.50, 1.0)
+GRID_MINOR_COLOR: Final         = RGBA(0.80, 0.80, 0.80, 1.0)
+
+PCB_MASK_COLOR: Final           = RGBA(0.15, 0.35, 0.15, 1.00)
+PCB_OUTLINE_COLOR: Final        = RGBA(0.00, 0.00, 0.00, 1.00)
+PCB_TOP_PASTE_COLOR: Final      = RGBA(0.55, 0.55, 0.55, 1.00)
+PCB_TOP_SILK_COLOR: Final       = RGBA(0.95, 0.95, 0.95, 1.00)
+PCB_TOP_MASK_COLOR: Final       = RGBA(0.75, 0.65, 0.00, 1.00)
+PCB_TOP_TRACES_COLOR: Final     = RGBA(0.00, 0.50, 0.00, 0.50)
+PCB_BOTTOM_TRACES_COLOR: Final  = RGBA(0.00, 0.50, 0.00, 0.50)
+PCB_BOTTOM_MASK_COLOR: Final    = RGBA(0.75, 0.65, 0.00, 1.00)
+PCB_BOTTOM_SILK_COLOR: Final    = RGBA(0.95, 0.95, 0.95, 1.00)
+PCB_BOTTOM_PASTE_COLOR: Final   = RGBA(0.55, 0.55, 0.55, 1.00)
+PCB_DRILL_NPTH_COLOR: Final     = RGBA(0.12, 0.12, 0.12, 0.80)
+PCB_DRILL_PTH_COLOR: Final      = RGBA(0.30, 0.15, 0.00, 0.50)
+
+PCB_BITE_GOOD_COLOR: Final      = RGBA(0.25, 0.85, 0.25, 0.75)
+PCB_BITE_BAD_COLOR: Final       = RGBA(0.85, 0.25, 0.25, 0.75)
@@ -22,7 +22,7 @@
 
 
 import math
-from kivy.graphics import Line, ClearBuffers, ClearColor
+from kivy.graphics import Line, ClearBuffers, ClearColor, Color
 from Constants import *
 
 
@@ -29,7 +29,7 @@ from os.path import join
 import kivy
 from kivy.base import EventLoop
 from kivy.uix.image import Image
-from kivy.graphics import Scale, Rectangle, Line
+from kivy.graphics import Fbo, ClearColor, ClearBuffers, Color, Scale, Rectangle, Line
 
 from Constants import *
 from Utilities import *
@@ -200,6 +200,13 @@ class PcbOutline:
         return self._size
 
 
+# the layer from the in memory rasters, if there are any, otherwise from its .png file
+def load_layer_image(path, rasters, name):
+    if rasters is not None:
+        return image_from_buffer(rasters.get(name))
+    return load_image(path, name + '.png')
+
+
 class Pcb:
     _colors = [
         PCB_MASK_COLOR,
@@ -221,7 +228,9 @@ class Pcb:
     _layers_bottom = [6, 7, 8, 9]
     _layers_verify = [0, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
 
-    def __init__(self, ids, path, name, **kwargs):
+    # rasters are the layers rendered in memory (see PcbFile.generate_pcb_data_layers) and outline_str the
+    # edge cuts mask outline, otherwise the layers are loaded from the .png files (and .txt outline) in path
+    def __init__(self, ids, path, name, rasters=None, outline_str=None, **kwargs):
         # print('PCB()')
         # print(' path: {}'.format(path))
         # print(' name: {}'.format(name))
@@ -233,15 +242,15 @@ class Pcb:
         else:
             self._name = os.path.basename(path)
 
-        image = load_image(path, 'edge_cuts_mask.png')
+        image = load_layer_image(path, rasters, 'edge_cuts_mask')
         if image is not None:
             self._size_pixels = image.texture_size
         else:
             self.invalid_reason = 'Missing \"edge_cuts_mask.png\"'
             self._size_pixels = (1, 1)
-            fallbacks = ['edge_cuts.png', 'top_copper.png', 'bottom_copper.png', 'top_mask.png', 'bottom_mask.png']
+            fallbacks = ['edge_cuts', 'top_copper', 'bottom_copper', 'top_mask', 'bottom_mask']
             for f in fallbacks:
-                image = load_image(path, f)
+                image = load_layer_image(path, rasters, f)
                 if image is not None:
                     image._fbo = Fbo(use_parent_projection=False, mipmap=True)
                     image._fbo.size = image.texture_size
@@ -253,7 +262,7 @@ class Pcb:
                     self._size_pixels = image.texture_size
                     break
 
-        outline_path = load_file(path, 'edge_cuts_mask.txt')
+        outline_path = outline_str if outline_str is not None else load_file(path, 'edge_cuts_mask.txt')
         if outline_path is not None:
             outline = PcbOutline(outline_path, max(self._size_pixels[0], self._size_pixels[1]))
             colored_outline = OffScreenImage(outline, None)
@@ -274,37 +283,37 @@ class Pcb:
 
         self._images.append(colored_mask(image, PCB_MASK_COLOR))
 
-        image = load_image(path, 'edge_cuts.png')
+        image = load_layer_image(path, rasters, 'edge_cuts')
         self._images.append(colored_mask(image, PCB_TOP_PASTE_COLOR))
 
-        image = load_image(path, 'top_paste.png')
+        image = load_layer_image(path, rasters, 'top_paste')
         self._images.append(colored_mask(image, PCB_TOP_PASTE_COLOR))
 
-        image = load_image(path, 'top_silk.png')
+        image = load_layer_image(path, rasters, 'top_silk')
         self._images.append(colored_mask(image, PCB_TOP_SILK_COLOR))
 
-        image = load_image(path, 'top_mask.png')
+        image = load_layer_image(path, rasters, 'top_mask')
         self._images.append(colored_mask(image, PCB_TOP_MASK_COLOR))
 
-        image = load_image(path, 'top_copper.png')
+        image = load_layer_image(path, rasters, 'top_copper')
         self._images.append(colored_mask(image, PCB_TOP_TRACES_COLOR))
 
-        image = load_image(path, 'bottom_copper.png')
+        image = load_layer_image(path, rasters, 'bottom_copper')
         self._images.append(colored_mask(image, PCB_BOTTOM_TRACES_COLOR))
 
-        image = load_image(path, 'bottom_mask.png')
+        image = load_layer_image(path, rasters, 'bottom_mask')
         self._images.append(colored_mask(image, PCB_BOTTOM_MASK_COLOR))
 
-        image = load_image(path, 'bottom_silk.png')
+        image = load_layer_image(path, rasters, 'bottom_silk')
         self._images.append(colored_mask(image, PCB_BOTTOM_SILK_COLOR))
 
-        image = load_image(path, 'bottom_paste.png')
+        image = load_layer_image(path, rasters, 'bottom_paste')
         self._images.append(colored_mask(image, PCB_BOTTOM_PASTE_COLOR))
 
-        image = load_image(path, 'drill_npth.png')
+        image = load_layer_image(path, rasters, 'drill_npth')
         self._images.append(colored_mask(image, PCB_DRILL_NPTH_COLOR))
 
-        image = load_image(path, 'drill_pth.png')
+        image = load_layer_image(path, rasters, 'drill_pth')
         self._images.append(colored_mask(image, PCB_DRILL_PTH_COLOR))
 
         if colored_outline is not None:
@@ -23,9 +23,13 @@
 
 import os
 import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 import hm_gerber_ex
 from hm_gerber_ex import GerberComposition, DrillComposition
+from hm_gerber_ex.utility import IDENTITY_MATRIX, translation_matrix, rotation_matrix, multiply_matrix
+from hm_gerber_ex.coordinates import HAS_NUMPY
 from hm_gerber_tool.cam import FileSettings
 from hm_gerber_tool.utils import listdir
 
@@ -38,6 +42,33 @@ DEBUG_PANEL_EXPORT = False
 DEBUG_PANEL_EXPORT_ANGLE = 0.0
 
 
+# parsed (and converted to metric) source files, keyed by (directory, filename, mtime), so that every
+# source file is read only once per export, no matter how many times it is placed on the panel
+#
+# the export only merges the statements, so the primitives are never built
+def read_cached(cache, directory, filename):
+    full_path = os.path.join(directory, filename)
+    key = (directory, filename, os.path.getmtime(full_path))
+    file = cache.get(key)
+    if file is None:
+        file = hm_gerber_ex.read(full_path, statements_only=True)
+        if HAS_NUMPY and isinstance(file, hm_gerber_ex.rs274x.GerberFile):
+            # vectorized offset() and rotate()
+            file.use_columns()
+        file.to_metric()
+        cache[key] = file
+    # offset() and rotate() modify the file in place, so every instance gets its own (cheap) copy
+    return file.clone()
+
+
+def listdir_cached(cache, directory):
+    filenames = cache.get(directory)
+    if filenames is None:
+        filenames = listdir(directory, True, True)
+        cache[directory] = filenames
+    return filenames
+
+
 def is_pth(name):
     if '-npth' in name.lower():
         return False
@@ -72,11 +103,179 @@ extensions_to_names = {
 }
 
 
+# the layers that can use Gerber step and repeat (%SR%) blocks for the Pcb boards
+# (the edge cuts need to be split at the mouse bites individually for every board)
+step_repeat_extensions = [
+    '.gbl',
+    '.gbo',
+    '.gbp',
+    '.gbs',
+    '.gtl',
+    '.gto',
+    '.gtp',
+    '.gts',
+]
+
+
+# returns (x_repeat, y_repeat, x_step, y_step) if the boards form a regular grid, otherwise None
+#
+# the board origins are rounded down to 0.01cm, so the pitch of the grid can be off by up to 0.1mm
+def step_repeat_from_boards(boards, error=0.1):
+    if len(boards) < 2:
+        return None
+    angle = boards[0][4]
+    x_min = min(board[2] for board in boards)
+    x_max = max(board[2] for board in boards)
+    y_min = min(board[3] for board in boards)
+    y_max = max(board[3] for board in boards)
+    x_repeat = len(set(round(board[2], 4) for board in boards))
+    y_repeat = len(set(round(board[3], 4) for board in boards))
+    if x_repeat * y_repeat != len(boards):
+        return None
+    x_step = 0.0
+    if x_repeat > 1:
+        x_step = (x_max - x_min) / (x_repeat - 1)
+    y_step = 0.0
+    if y_repeat > 1:
+        y_step = (y_max - y_min) / (y_repeat - 1)
+    cells = set()
+    for use_bounds_offset, path, x_offset, y_offset, rotate, step_repeat in boards:
+        if rotate != angle:
+            return None
+        column = 0
+        if x_step > 0.0:
+            column = round((x_offset - x_min) / x_step)
+        row = 0
+        if y_step > 0.0:
+            row = round((y_offset - y_min) / y_step)
+        if not equal_floats(x_offset, x_min + column * x_step, error):
+            return None
+        if not equal_floats(y_offset, y_min + row * y_step, error):
+            return None
+        cells.add((column, row))
+    if len(cells) != len(boards):
+        return None
+    return x_repeat, y_repeat, x_step, y_step
+
+
+# moves the boards onto the exact grid of the step and repeat block, so that the explicitly
+# copied layers (edge cuts, drills) line up with the step and repeated ones
+def snap_boards_to_grid(boards, step_repeat):
+    x_repeat, y_repeat, x_step, y_step = step_repeat
+    x_min = min(board[2] for board in boards)
+    y_min = min(board[3] for board in boards)
+    snapped = []
+    for use_bounds_offset, path, x_offset, y_offset, rotate, _ in boards:
+        if x_step > 0.0:
+            x_offset = x_min + round((x_offset - x_min) / x_step) * x_step
+        if y_step > 0.0:
+            y_offset = y_min + round((y_offset - y_min) / y_step) * y_step
+        snapped.append((use_bounds_offset, path, x_offset, y_offset, rotate, None))
+    return snapped
+
+
+def init_export_worker(settings):
+    # worker processes do not necessarily inherit the app settings (ex. "spawn" on macOS)
+    AppSettings.set(*settings)
+
+
+# merges the given layer (ext) of all the boards into a panel layer and writes it into panel_path
+def export_panel_layer(ext, boards, pcb_origin_x_mm, pcb_origin_y_mm, mouse_bites_cutouts, panel_path,
+                       verbose=False, files_cache=None, listdir_cache=None, progress_queue=None,
+                       step_repeat_boards=None):
+    if step_repeat_boards is not None and ext in step_repeat_extensions:
+        boards = step_repeat_boards
+    if files_cache is None:
+        files_cache = {}
+    if listdir_cache is None:
+        listdir_cache = {}
+
+    if verbose:
+        print('\nPROCESS: {}'.format(ext))
+
+    if ext == '.drl':
+        settings = FileSettings(format=(3, 3), zeros='decimal', zero_suppression='trailing')
+        ctx_npth_drl = DrillComposition(settings)
+        ctx_pth_drl = DrillComposition(settings)
+        ctx = None
+    else:
+        cutout_lines = None
+        if ext == '.gm1':
+            cutout_lines = mouse_bites_cutouts
+        ctx = SplitGerberComposition(cutout_lines=cutout_lines)
+    file = None
+
+    # board
+    for use_bounds_offsets, directory, x_offset, y_offset, angle, step_repeat in boards:
+        directory = os.path.abspath(directory)
+        if not os.path.isdir(directory):
+            raise TypeError('{} is not a directory.'.format(directory))
+
+        # ext in board
+        for filename in listdir_cached(listdir_cache, directory):
+            filename_ext = os.path.splitext(filename)[1].lower()
+            if ext == filename_ext:
+                if ext == '.drl':
+                    if is_pth(filename):
+                        ctx = ctx_pth_drl
+                    else:
+                        ctx = ctx_npth_drl
+
+                if verbose:
+                    print(' FILE: {}'.format(filename))
+                if progress_queue is not None:
+                    progress_queue.put('exporting panel{} ({}) ...'.format(ext, filename))
+                file = read_cached(files_cache, directory, filename)
+                matrix = IDENTITY_MATRIX
+                if use_bounds_offsets:
+                    # move to 0,0 before rotation
+                    matrix = translation_matrix((-pcb_origin_x_mm), (-pcb_origin_y_mm))
+                if angle != 0.0:
+                    # rotate
+                    matrix = multiply_matrix(rotation_matrix(angle), matrix)
+                # final offset
+                matrix = multiply_matrix(translation_matrix((x_offset), (y_offset)), matrix)
+                # all at once, and without the primitives (not needed for merging)
+                if ext == '.drl':
+                    file.transform(matrix)
+                else:
+                    file.transform(matrix, primitives=False)
+                if verbose:
+                    print(' MERGING')
+                if step_repeat is not None:
+                    ctx.merge(file, step_repeat)
+                else:
+                    ctx.merge(file)
+
+    if ext == '.drl':
+        full_path = os.path.join(panel_path, 'drill-NPTH.drl')
+        if verbose:
+            print('\nWRITING: {}'.format(full_path))
+        ctx_npth_drl.dump(full_path)
+        if verbose:
+            print('DONE\n')
+
+        full_path = os.path.join(panel_path, 'drill-PTH.drl')
+        if verbose:
+            print('\nWRITING: {}'.format(full_path))
+        ctx_pth_drl.dump(full_path)
+        if verbose:
+            print('DONE\n')
+    elif file is not None:
+        new_name = extensions_to_names.get(ext, 'unknown')
+        full_path = os.path.join(panel_path, new_name + ext)
+        if verbose:
+            print('\nWRITING: {}'.format(full_path))
+        ctx.dump(full_path)
+        if verbose:
+            print('DONE\n')
+
+
 def export_pcb_panel(progress, panel_path,
                      pcb_path, pcb_origins, pcb_rect_mm,
                      rail_path, rail_origins,
                      mouse_bite_path, mouse_bite_origins, mouse_bite_width_mm, mouse_bite_height_mm,
-                     angle, verbose=True):
+                     angle, verbose=True, workers=1, step_repeat=False):
     if verbose:
         print('\nexport_pcb_panel')
         print(' panel_path: {}'.format(panel_path))
@@ -173,11 +372,31 @@ def export_pcb_panel(progress, panel_path,
         offset_x = 0.0
         if rotate != 0.0:
             offset_x = pcb_height_mm
-        boards.append((use_bounds_offset, path, (offset_x+10.0*origin[0]), (10.0*origin[1]), rotate))
+        boards.append((use_bounds_offset, path, (offset_x+10.0*origin[0]), (10.0*origin[1]), rotate, None))
+
+    # the Pcb boards are written only once, inside a step and repeat block, if they form a regular grid
+    step_repeat_boards = None
+    if step_repeat:
+        pcb_boards = boards[rail_count:rail_count+pcb_count]
+        pcb_step_repeat = step_repeat_from_boards(pcb_boards)
+        if pcb_step_repeat is not None:
+            pcb_boards = snap_boards_to_grid(pcb_boards, pcb_step_repeat)
+            boards = boards[:rail_count] + pcb_boards + boards[rail_count+pcb_count:]
+            use_bounds_offset, path, x_offset, y_offset, rotate, _ = min(pcb_boards, key=lambda b: (b[3], b[2]))
+            step_repeat_boards = boards[:rail_count]
+            step_repeat_boards.append((use_bounds_offset, path, x_offset, y_offset, rotate, pcb_step_repeat))
+            step_repeat_boards.extend(boards[rail_count+pcb_count:])
+        elif verbose:
+            print(' pcb boards do not form a regular grid, not using step and repeat')
+
     if verbose:
         print(' boards:')
         for board in boards:
             print('  {}'.format(board))
+        if step_repeat_boards is not None:
+            print(' step_repeat_boards:')
+            for board in step_repeat_boards:
+                print('  {}'.format(board))
         directory = os.path.abspath(pcb_path)
         print('\npcb files in {}:'.format(directory))
         for filename in listdir(directory, True, True):
@@ -192,85 +411,44 @@ def export_pcb_panel(progress, panel_path,
             print(' {}'.format(filename))
         print('\n\n')
 
-    settings = FileSettings(format=(3, 3), zeros='decimal', zero_suppression='trailing')
-    ctx_npth_drl = DrillComposition(settings)
-    ctx_pth_drl = DrillComposition(settings)
-    ctx = None
-
     progress_steps = 12.0
     progress_value = 0.2
     progress_chunk = (1.0 - progress_value) / progress_steps
 
-    # ext
-    for ext in extensions:
-        if verbose:
-            print('\nPROCESS: {}'.format(ext))
-
-        progress_value += progress_chunk
-        update_progressbar(progress, 'exporting panel{} ...'.format(ext), progress_value)
-
-        if ext != '.drl':
-            cutout_lines = None
-            if ext == '.gm1':
-                cutout_lines = mouse_bites_cutouts
-            ctx = SplitGerberComposition(cutout_lines=cutout_lines)
-        file = None
-
-        # board
-        for use_bounds_offsets, directory, x_offset, y_offset, angle in boards:
-            directory = os.path.abspath(directory)
-            if not os.path.isdir(directory):
-                raise TypeError('{} is not a directory.'.format(directory))
-
-            # ext in board
-            for filename in listdir(directory, True, True):
-                filename_ext = os.path.splitext(filename)[1].lower()
-                if ext == filename_ext:
-                    if ext == '.drl':
-                        if is_pth(filename):
-                            ctx = ctx_pth_drl
-                        else:
-                            ctx = ctx_npth_drl
-
-                    full_path = os.path.join(directory, filename)
-                    if verbose:
-                        print(' FILE: {}'.format(filename))
-                    file = hm_gerber_ex.read(full_path)
-                    file.to_metric()
-                    if use_bounds_offsets:
-                        # move to 0,0 before rotation
-                        file.offset((-pcb_origin_x_mm), (-pcb_origin_y_mm))
-                    if angle != 0.0:
-                        # rotate
-                        file.rotate(angle)
-                    # final offset
-                    file.offset((x_offset), (y_offset))
-                    if verbose:
-                        print(' MERGING')
-                    ctx.merge(file)
-
-        if file is not None and ext != '.drl':
-            new_name = extensions_to_names.get(ext, 'unknown')
-            full_path = os.path.join(panel_path, new_name + ext)
-            if verbose:
-                print('\nWRITING: {}'.format(full_path))
-            ctx.dump(full_path)
-            if verbose:
-                print('DONE\n')
-
-    full_path = os.path.join(panel_path, 'drill-NPTH.drl')
-    if verbose:
-        print('\nWRITING: {}'.format(full_path))
-    ctx_npth_drl.dump(full_path)
-    if verbose:
-        print('DONE\n')
-
-    full_path = os.path.join(panel_path, 'drill-PTH.drl')
-    if verbose:
-        print('\nWRITING: {}'.format(full_path))
-    ctx_pth_drl.dump(full_path)
-    if verbose:
-        print('DONE\n')
+    if workers > 1:
+        # every layer (ext) is independent of the others, so export each one in its own worker process
+        settings = (AppSettings.gap, AppSettings.rail, AppSettings.bites_count, AppSettings.bite,
+                    AppSettings.bite_hole_radius, AppSettings.bite_hole_space, AppSettings.use_vcut,
+                    AppSettings.use_jlc, AppSettings.merge_error, AppSettings.use_step_repeat)
+        with multiprocessing.Manager() as manager:
+            progress_queue = manager.Queue()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_export_worker,
+                                     initargs=(settings,)) as executor:
+                futures = {}
+                for ext in extensions:
+                    future = executor.submit(export_panel_layer, ext, boards, pcb_origin_x_mm, pcb_origin_y_mm,
+                                             mouse_bites_cutouts, panel_path, verbose, None, None, progress_queue,
+                                             step_repeat_boards)
+                    futures[future] = ext
+                pending = set(futures)
+                while len(pending) > 0:
+                    done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    while not progress_queue.empty():
+                        update_progressbar(progress, progress_queue.get(), progress_value)
+                    for future in done:
+                        # re-raises any exception from the worker
+                        future.result()
+                        progress_value += progress_chunk
+                        update_progressbar(progress, 'exported panel{}'.format(futures[future]), progress_value)
+    else:
+        files_cache = {}
+        listdir_cache = {}
+        for ext in extensions:
+            progress_value += progress_chunk
+            update_progressbar(progress, 'exporting panel{} ...'.format(ext), progress_value)
+            export_panel_layer(ext, boards, pcb_origin_x_mm, pcb_origin_y_mm,
+                               mouse_bites_cutouts, panel_path, verbose, files_cache, listdir_cache, None,
+                               step_repeat_boards)
 
     fix_drl_routing(panel_path)
 
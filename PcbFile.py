@@ -24,20 +24,16 @@
 import os
 import math
 from os.path import join
-from kivy.uix.image import Image
-from kivy.graphics import Scale, Rectangle, Line
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 import Utilities
 from hm_gerber_tool import PCB
-from hm_gerber_tool.render import theme
 from hm_gerber_tool.layers import PCBLayer
-from hm_gerber_tool.render import GerberCairoContext, theme
 from hm_gerber_tool.common import rs274x
 from hm_gerber_tool.common import excellon
 
 from Constants import *
 from Utilities import *
-from OffScreenImage import *
 
 
 def log_text(progressbar, text=None, value=None):
@@ -47,25 +43,103 @@ def log_text(progressbar, text=None, value=None):
         print(text)
 
 
-def generate_pcb_data_layers(cwd, pcb_rel_path, data_rel_path, progressbar=None, board_name=None):
+# cairo is only imported by the functions that render, so that the Gerber generators
+# (and the panel export) can be used without it (ex. by do_panelize.py)
+#
+# renders the edge cuts mask, returns its outline and raster (see GerberCairoContext.dump_buffer)
+def render_pcb_data_outline(layer, file_path, bounds, resolution):
+    from hm_gerber_tool.render import GerberCairoContext
+    ctx = GerberCairoContext(resolution)
+    outline_str = ctx.get_outline_mask(layer, file_path, bounds=bounds, verbose=False)
+    return outline_str, ctx.dump_buffer()
+
+
+# renders a layer, returns its raster, the outline is rendered again if the layer is clipped to it,
+# since the worker processes do not share their contexts
+def render_pcb_data_layer(layer, file_path, bounds, resolution, outline_layer=None):
+    from hm_gerber_tool.render import GerberCairoContext, theme
+    ctx = GerberCairoContext(resolution)
+    clip_to_outline = outline_layer is not None
+    if clip_to_outline:
+        ctx.get_outline_mask(outline_layer, None, bounds=bounds, verbose=False)
+    ctx.render_clipped_layer(layer, clip_to_outline, file_path, theme.THEMES['Mask'], bounds=bounds,
+                             background=False, verbose=False)
+    return ctx.dump_buffer()
+
+
+# every layer is an independent raster job, so render each one in its own worker process,
+# returns the same rasters (and writes the same files) as the serial path of generate_pcb_data_layers
+def render_pcb_data_layers_parallel(pcb, data_path, bounds, resolution, get_outline, clip_to_outline,
+                                    print_outline, workers, progressbar=None):
+    rasters = {}
+    outline_str = None
+    outline_layer = pcb.edge_cuts_layer
+    progressbar_value = 0.5
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        if get_outline and outline_layer is not None:
+            file_path = pcb_data_file_path(data_path, 'edge_cuts_mask')
+            future = executor.submit(render_pcb_data_outline, outline_layer, file_path, bounds, resolution)
+            futures[future] = 'edge_cuts_mask'
+        for layer in pcb.layers:
+            file_path = pcb_data_file_path(data_path, layer.name())
+            future = executor.submit(render_pcb_data_layer, layer, file_path, bounds, resolution,
+                                     outline_layer if clip_to_outline else None)
+            futures[future] = layer.name()
+        log_text(progressbar, 'Rendering {} layers ...'.format(len(futures)), progressbar_value)
+        progressbar_advance = 0.5 / len(futures)
+        pending = set(futures)
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                # re-raises any exception from the worker
+                if name == 'edge_cuts_mask':
+                    outline_str, rasters[name] = future.result()
+                    if print_outline and outline_str is not None:
+                        print('\n{}'.format(outline_str))
+                    text = 'Rendered mask for layer \"{}\"'.format(outline_layer.name())
+                else:
+                    rasters[name] = future.result()
+                    text = 'Rendered layer \"{}\"'.format(name)
+                progressbar_value += progressbar_advance
+                log_text(progressbar, text, progressbar_value)
+    return rasters, outline_str
+
+
+# the layer files are only written when data_path is given
+def pcb_data_file_path(data_path, name):
+    if data_path is None:
+        return None
+    return os.path.join(data_path, name)
+
+
+# renders the layers of the PCB in pcb_rel_path, returns their rasters (see GerberCairoContext.dump_buffer)
+# by layer name, plus "edge_cuts_mask", and the outline of the edge cuts mask (None if there is no PCB)
+#
+# the layers are written into .png files in data_rel_path (and the outline into edge_cuts_mask.txt) as well,
+# if write_files is True
+def generate_pcb_data_layers(cwd, pcb_rel_path, data_rel_path, progressbar=None, board_name=None,
+                             workers=PCB_RENDER_WORKERS, write_files=PCB_WRITE_LAYER_FILES):
     pcb_path = os.path.abspath(os.path.join(cwd, pcb_rel_path))
-    data_path = os.path.abspath(os.path.join(cwd, data_rel_path))
+    data_path = os.path.abspath(os.path.join(cwd, data_rel_path)) if write_files else None
 
     progressbar_value = 0.1
 
-    try:
-        os.mkdir(data_path)
-    except FileExistsError:
-        pass
+    if data_path is not None:
+        try:
+            os.mkdir(data_path)
+        except FileExistsError:
+            pass
 
     print('\n')
     if board_name is None:
         board_name = pcb_path
     text = 'Reading PCB \"{}\"'.format(board_name)
     log_text(progressbar, text, progressbar_value)
-    pcb = PCB.from_directory(pcb_path, verbose=True)
+    pcb = PCB.from_directory(pcb_path, verbose=True, workers=PCB_LOAD_WORKERS)
     if pcb is None:
-        return
+        return None, None
 
     print('\n')
     progressbar_value = 0.25
@@ -82,33 +156,49 @@ def generate_pcb_data_layers(cwd, pcb_rel_path, data_rel_path, progressbar=None,
 
     size = bounds_to_size(bounds)
     resolution = size_to_resolution(size, PIXELS_PER_MM, PIXELS_SIZE_MIN, PIXELS_SIZE_MAX)
+
+    if workers > 1:
+        rasters, outline_str = render_pcb_data_layers_parallel(pcb, data_path, bounds, resolution, get_outline,
+                                                               clip_to_outline, print_outline, workers,
+                                                               progressbar)
+        log_text(progressbar, 'Done', 1.0)
+        print('\n')
+        return rasters, outline_str
+
+    from hm_gerber_tool.render import GerberCairoContext, theme
+    rasters = {}
+    outline_str = None
     ctx = GerberCairoContext(resolution)
 
     if get_outline:
-        file_path = os.path.join(data_path, 'edge_cuts_mask')
+        file_path = pcb_data_file_path(data_path, 'edge_cuts_mask')
         layer = pcb.edge_cuts_layer
         if layer is not None:
             text = 'Rendering mask for layer \"{}\"'.format(layer.name())
             progressbar_value = 0.5
             log_text(progressbar, text, progressbar_value)
             outline_str = ctx.get_outline_mask(layer, file_path, bounds=bounds, verbose=False)
+            rasters['edge_cuts_mask'] = ctx.dump_buffer()
             if print_outline and outline_str is not None:
                 print('\n{}'.format(outline_str))
 
     layers = pcb.layers
     progressbar_advance = 0.5 / len(layers)
     for layer in pcb.layers:
-        file_path = os.path.join(data_path, '{}'.format(layer.name()))
+        file_path = pcb_data_file_path(data_path, layer.name())
         text = 'Rendering layer \"{}\"'.format(layer.name())
         log_text(progressbar, text, progressbar_value)
         progressbar_value += progressbar_advance
         ctx.render_clipped_layer(layer, clip_to_outline, file_path, theme.THEMES['Mask'], bounds=bounds,
                                  background=False, verbose=False)
+        rasters[layer.name()] = ctx.dump_buffer()
 
     log_text(progressbar, 'Done', 1.0)
 
     print('\n')
 
+    return rasters, outline_str
+
 
 def generate_float46(value):
     data = ''
@@ -670,6 +760,7 @@ def render_pcb_layer(bounds, layer, path, filename, outline=False, verbose=False
         bounds = layer.bounds
     size = bounds_to_size(bounds)
     resolution = size_to_resolution(size, PIXELS_PER_MM, PIXELS_SIZE_MIN, PIXELS_SIZE_MAX)
+    from hm_gerber_tool.render import GerberCairoContext, theme
     ctx = GerberCairoContext(resolution)
     if outline:
         ctx.get_outline_mask(layer, os.path.join(path, filename+'_mask'),
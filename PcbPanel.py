@@ -21,7 +21,7 @@
 # THE SOFTWARE.
 
 
-from kivy.graphics import Rectangle, Translate, Rotate, PushMatrix, PopMatrix
+from kivy.graphics import ClearColor, ClearBuffers, Color, Rectangle, Translate, Rotate, PushMatrix, PopMatrix
 
 from AppSettings import *
 from Array2D import *
@@ -34,6 +34,7 @@ from PcbMouseBites import *
 from PcbRail import *
 from UI import DemoLabel
 from Utilities import *
+import PcbPanelLayout
 
 
 class PcbPanel(OffScreenScatter):
@@ -119,25 +120,9 @@ class PcbPanel(OffScreenScatter):
         self.paint()
 
     def calculate_sizes(self, scale, columns, rows):
-        pcb_width = self._client.size_mm[0]
-        pcb_height = self._client.size_mm[1]
-        if self._angle != 0.0:
-            pcb_width = self._client.size_mm[1]
-            pcb_height = self._client.size_mm[0]
-
-        panel_width = 0
-        panel_width += pcb_width
-        for c in range(0, columns - 1):
-            panel_width += AppSettings.gap
-            panel_width += pcb_width
-
-        panel_height = 0
-        panel_height += AppSettings.rail
-        panel_height += AppSettings.gap
-        for r in range(0, rows):
-            panel_height += pcb_height
-            panel_height += AppSettings.gap
-        panel_height += AppSettings.rail
+        panel_width, panel_height = PcbPanelLayout.get_panel_size_mm(self._client.size_mm[0],
+                                                                     self._client.size_mm[1],
+                                                                     columns, rows, self._angle)
 
         self._size_mm = (panel_width, panel_height)
         self._size_pixels = (round_float(panel_width * scale), round_float(panel_height * scale))
@@ -289,59 +274,15 @@ class PcbPanel(OffScreenScatter):
         return self._bites.get_row_xs_mm(scale)
 
     def get_rails_origins(self, pcb_width_mm, pcb_height_mm):
-        origins = []
-        pcb_height_cm = pcb_height_mm / 10.0
-        if self._angle != 0.0:
-            pcb_height_cm = pcb_width_mm / 10.0
-        gap_cm = AppSettings.gap / 10.0
-        rail_cm = AppSettings.rail / 10.0
-        y_coord = 0.0
-        origins.append((0.0, round_down(y_coord)))
-        y_coord += rail_cm + gap_cm
-        row_height = pcb_height_cm + gap_cm
-        y_coord += self._rows * row_height
-        origins.append((0.0, round_down(y_coord)))
-        return origins
+        return PcbPanelLayout.get_rails_origins(pcb_width_mm, pcb_height_mm, self._rows, self._angle)
 
     def get_mouse_bites_origins(self, pcb_width_mm, pcb_height_mm):
-        origins = []
         row_mouse_bites_xs = self.get_row_mouse_bites_xs_mm()
-        pcb_width_cm = pcb_width_mm / 10.0
-        pcb_height_cm = pcb_height_mm / 10.0
-        if self._angle != 0.0:
-            pcb_width_cm = pcb_height_mm / 10.0
-            pcb_height_cm = pcb_width_mm / 10.0
-        gap_cm = AppSettings.gap / 10.0
-        rail_cm = AppSettings.rail / 10.0
-        y_coord = rail_cm
-        for y in range(self._rows+1):
-            x_coord = 0.0
-            row_origins = []
-            for x in range(self._columns):
-                for ox in row_mouse_bites_xs:
-                    row_origins.append((round_down(x_coord + ox), round_down(y_coord)))
-                x_coord += pcb_width_cm + gap_cm
-            origins.append(row_origins)
-            y_coord += pcb_height_cm + gap_cm
-        return origins
+        return PcbPanelLayout.get_mouse_bites_origins(pcb_width_mm, pcb_height_mm, self._columns, self._rows,
+                                                      self._angle, row_mouse_bites_xs)
 
     def get_pcbs_origins(self, pcb_width_mm, pcb_height_mm):
-        origins = []
-        pcb_width_cm = pcb_width_mm / 10.0
-        pcb_height_cm = pcb_height_mm / 10.0
-        if self._angle != 0.0:
-            pcb_width_cm = pcb_height_mm / 10.0
-            pcb_height_cm = pcb_width_mm / 10.0
-        gap_cm = AppSettings.gap / 10.0
-        rail_cm = AppSettings.rail / 10.0
-        y_coord = rail_cm + gap_cm
-        for y in range(self._rows):
-            x_coord = 0.0
-            for x in range(self._columns):
-                origins.append((round_down(x_coord), round_down(y_coord)))
-                x_coord += pcb_width_cm + gap_cm
-            y_coord += pcb_height_cm + gap_cm
-        return origins
+        return PcbPanelLayout.get_pcbs_origins(pcb_width_mm, pcb_height_mm, self._columns, self._rows, self._angle)
 
     # DO NOT RELAY ON THESE VALUES FOR THE ACTUAL PCB LAYOUT
     # THEY CONTAIN ROUNDING ERRORS FROM SCREEN SPACE TO MM SPACE CONVERSION !
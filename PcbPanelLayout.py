@@ -0,0 +1,126 @@
+# The MIT License (MIT)
+
+# Copyright 2021,2022 HalfMarble LLC
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+from AppSettings import *
+from Utilities import *
+
+
+# the panel layout math (in cm, like the rest of the panel), shared by PcbPanel and do_panelize.py,
+# so it must not depend on kivy
+
+
+def get_rotated_size_mm(pcb_width_mm, pcb_height_mm, angle):
+    if angle != 0.0:
+        return pcb_height_mm, pcb_width_mm
+    else:
+        return pcb_width_mm, pcb_height_mm
+
+
+def get_panel_size_mm(pcb_width_mm, pcb_height_mm, columns, rows, angle):
+    pcb_width, pcb_height = get_rotated_size_mm(pcb_width_mm, pcb_height_mm, angle)
+
+    panel_width = 0
+    panel_width += pcb_width
+    for c in range(0, columns - 1):
+        panel_width += AppSettings.gap
+        panel_width += pcb_width
+
+    panel_height = 0
+    panel_height += AppSettings.rail
+    panel_height += AppSettings.gap
+    for r in range(0, rows):
+        panel_height += pcb_height
+        panel_height += AppSettings.gap
+    panel_height += AppSettings.rail
+
+    return panel_width, panel_height
+
+
+# the mouse bites are evenly distributed along the pcb width, until moved by the user (see PcbGap)
+def get_row_mouse_bites_xs(pcb_width_mm, pcb_height_mm, angle, bites_count):
+    xs = []
+    pcb_width_mm, pcb_height_mm = get_rotated_size_mm(pcb_width_mm, pcb_height_mm, angle)
+    pcb_width_cm = pcb_width_mm / 10.0
+    for i in range(bites_count):
+        slide = (float(i + 1) / float(bites_count + 1))
+        xs.append(slide * pcb_width_cm)
+    return xs
+
+
+def get_rails_origins(pcb_width_mm, pcb_height_mm, rows, angle):
+    origins = []
+    pcb_height_cm = pcb_height_mm / 10.0
+    if angle != 0.0:
+        pcb_height_cm = pcb_width_mm / 10.0
+    gap_cm = AppSettings.gap / 10.0
+    rail_cm = AppSettings.rail / 10.0
+    y_coord = 0.0
+    origins.append((0.0, round_down(y_coord)))
+    y_coord += rail_cm + gap_cm
+    row_height = pcb_height_cm + gap_cm
+    y_coord += rows * row_height
+    origins.append((0.0, round_down(y_coord)))
+    return origins
+
+
+def get_mouse_bites_origins(pcb_width_mm, pcb_height_mm, columns, rows, angle, row_mouse_bites_xs):
+    origins = []
+    pcb_width_cm = pcb_width_mm / 10.0
+    pcb_height_cm = pcb_height_mm / 10.0
+    if angle != 0.0:
+        pcb_width_cm = pcb_height_mm / 10.0
+        pcb_height_cm = pcb_width_mm / 10.0
+    gap_cm = AppSettings.gap / 10.0
+    rail_cm = AppSettings.rail / 10.0
+    y_coord = rail_cm
+    for y in range(rows+1):
+        x_coord = 0.0
+        row_origins = []
+        for x in range(columns):
+            for ox in row_mouse_bites_xs:
+                row_origins.append((round_down(x_coord + ox), round_down(y_coord)))
+            x_coord += pcb_width_cm + gap_cm
+        origins.append(row_origins)
+        y_coord += pcb_height_cm + gap_cm
+    return origins
+
+
+def get_pcbs_origins(pcb_width_mm, pcb_height_mm, columns, rows, angle):
+    origins = []
+    pcb_width_cm = pcb_width_mm / 10.0
+    pcb_height_cm = pcb_height_mm / 10.0
+    if angle != 0.0:
+        pcb_width_cm = pcb_height_mm / 10.0
+        pcb_height_cm = pcb_width_mm / 10.0
+    gap_cm = AppSettings.gap / 10.0
+    rail_cm = AppSettings.rail / 10.0
+    y_coord = rail_cm + gap_cm
+    for y in range(rows):
+        x_coord = 0.0
+        for x in range(columns):
+            origins.append((round_down(x_coord), round_down(y_coord)))
+            x_coord += pcb_width_cm + gap_cm
+        y_coord += pcb_height_cm + gap_cm
+    return origins
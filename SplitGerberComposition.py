@@ -21,14 +21,61 @@
 # THE SOFTWARE.
 
 
+from bisect import bisect_left, bisect_right
+from math import floor
+
 import hm_gerber_ex
 from hm_gerber_ex import GerberComposition
-from hm_gerber_tool.gerber_statements import CoordStmt, EofStmt
+from hm_gerber_ex.utility import chunked_writer
+from hm_gerber_tool.gerber_statements import CoordStmt, EofStmt, statements_to_gerber
 
 from AppSettings import *
 from Utilities import *
 
 
+# cutout lines bucketed by their quantized y, with the x intervals of every line sorted by their start,
+# so that a segment finds its cutouts without testing all of them
+#
+# the matching lines and cutouts are returned in their original order, to keep the output unchanged
+class CutoutIndex:
+
+    def __init__(self, cutout_lines, error):
+        self._error = error
+        self._quantum = max(error, 0.01)
+        self._buckets = {}
+        for i, cutout in enumerate(cutout_lines):
+            cutout_y = cutout[0]
+            lines = sorted(enumerate(cutout[1]), key=lambda line: line[1][0])
+            starts = [line[1][0] for line in lines]
+            key = floor(cutout_y / self._quantum)
+            self._buckets.setdefault(key, []).append((i, cutout_y, starts, lines))
+
+    # all the cutout lines within error of y
+    def rows(self, y):
+        found = []
+        for key in range(floor((y - self._error) / self._quantum), floor((y + self._error) / self._quantum) + 1):
+            for row in self._buckets.get(key, ()):
+                if equal_floats(row[1], y, self._error):
+                    found.append(row)
+        if len(found) > 1:
+            found.sort(key=lambda row: row[0])
+        return found
+
+    # all the cutouts of a cutout line (row) that fit between start_x and end_x
+    @staticmethod
+    def cutouts(row, start_x, end_x):
+        starts = row[2]
+        lines = row[3]
+        found = []
+        for i in range(bisect_left(starts, start_x), bisect_right(starts, end_x)):
+            line = lines[i]
+            if line[1][1] <= end_x:
+                found.append(line)
+        if len(found) > 1:
+            found.sort(key=lambda line: line[0])
+        return [line[1] for line in found]
+
+
 class SplitGerberComposition(GerberComposition):
 
     def __init__(self, settings=None, comments=None, cutout_lines=None):
@@ -41,34 +88,28 @@ class SplitGerberComposition(GerberComposition):
             print('#            LINE START  {},{} [{}] '
                   .format(start.x, start.y, start.to_gerber(self.settings)))
         f.write(start.to_gerber(self.settings) + '\n')
-        for cutout in cutouts:
-            cutout_y = cutout[0]
-            if equal_floats(cutout_y, round_down(start.y), AppSettings.merge_error):
-                lines = cutout[1]
-                for cutout_line in lines:
-                    start_cutout_x = cutout_line[0]
-                    end_cutout_x = cutout_line[1]
-                    if start_cutout_x >= start.x and end_cutout_x <= end.x:
-                        new_end = CoordStmt(None, start_cutout_x, cutout_y, None, None, 'D01', self.settings)
-                        new_start = CoordStmt(None, end_cutout_x, cutout_y, None, None, 'D02', self.settings)
-                        if verbose:
-                            print('#   INSERTING LINE END   {},{} [{}] '
-                                  .format(new_end.x, new_end.y, new_end.to_gerber(self.settings)))
-                            print('#   INSERTING LINE START {},{} [{}] '
-                                  .format(new_start.x, new_start.y, new_start.to_gerber(self.settings)))
-                        f.write(new_end.to_gerber(self.settings) + '\n')
-                        f.write(new_start.to_gerber(self.settings) + '\n')
+        for row in cutouts.rows(round_down(start.y)):
+            cutout_y = row[1]
+            for start_cutout_x, end_cutout_x in cutouts.cutouts(row, start.x, end.x):
+                new_end = CoordStmt(None, start_cutout_x, cutout_y, None, None, 'D01', self.settings)
+                new_start = CoordStmt(None, end_cutout_x, cutout_y, None, None, 'D02', self.settings)
+                if verbose:
+                    print('#   INSERTING LINE END   {},{} [{}] '
+                          .format(new_end.x, new_end.y, new_end.to_gerber(self.settings)))
+                    print('#   INSERTING LINE START {},{} [{}] '
+                          .format(new_start.x, new_start.y, new_start.to_gerber(self.settings)))
+                f.write(new_end.to_gerber(self.settings) + '\n')
+                f.write(new_start.to_gerber(self.settings) + '\n')
         if verbose:
             print('#            LINE END    {},{} [{}] '
                   .format(end.x, end.y, end.to_gerber(self.settings)))
         f.write(end.to_gerber(self.settings) + '\n')
         return True
 
-    def process_segment(self, f, i, lines, cutouts, verbose=False):
+    # end is the statement following start (None for the last one)
+    def process_segment(self, f, start, end, cutouts, verbose=False):
         split = False
-        start = lines[i]
-        if isinstance(start, CoordStmt) and start.op == 'D02' and len(lines) > (i+1):
-            end = lines[i + 1]
+        if isinstance(start, CoordStmt) and start.op == 'D02' and end is not None:
             if isinstance(end, CoordStmt) and end.op == 'D01':
                 if equal_floats(end.y, start.y, AppSettings.merge_error):
                     if verbose:
@@ -78,47 +119,49 @@ class SplitGerberComposition(GerberComposition):
                               .format(start.x, start.y, start.to_gerber(self.settings)))
                         print('# LINE END   {},{} [{}] '
                               .format(end.x, end.y, end.to_gerber(self.settings)))
-                    for cutout in cutouts:
-                        cutout_y = cutout[0]
-                        if equal_floats(cutout_y, round_down(end.y), AppSettings.merge_error):
+                    for row in cutouts.rows(round_down(end.y)):
+                        if verbose:
+                            print('#')
+                            print('#  MATCHING Y {}'.format(row[1]))
+                            print('#  LINE START {},{} [{}] '
+                                  .format(start.x, start.y, start.to_gerber(self.settings)))
+                            print('#  LINE END   {},{} [{}] '
+                                  .format(end.x, end.y, end.to_gerber(self.settings)))
+                        if end.x > start.x:
+                            if verbose:
+                                print('#  DIRECTION ----->')
+                        else:
+                            if verbose:
+                                print('#  DIRECTION <----- (SWAP NEEDED)')
+                            temp_x = end.x
+                            end.x = start.x
+                            start.x = temp_x
                             if verbose:
-                                print('#')
-                                print('#  MATCHING Y {}'.format(cutout_y))
-                                print('#  LINE START {},{} [{}] '
+                                print('#   NOW LINE START {},{} [{}] '
                                       .format(start.x, start.y, start.to_gerber(self.settings)))
-                                print('#  LINE END   {},{} [{}] '
+                                print('#   NOW LINE END   {},{} [{}] '
                                       .format(end.x, end.y, end.to_gerber(self.settings)))
-                            if end.x > start.x:
-                                if verbose:
-                                    print('#  DIRECTION ----->')
-                            else:
-                                if verbose:
-                                    print('#  DIRECTION <----- (SWAP NEEDED)')
-                                temp_x = end.x
-                                end.x = start.x
-                                start.x = temp_x
-                                if verbose:
-                                    print('#   NOW LINE START {},{} [{}] '
-                                          .format(start.x, start.y, start.to_gerber(self.settings)))
-                                    print('#   NOW LINE END   {},{} [{}] '
-                                          .format(end.x, end.y, end.to_gerber(self.settings)))
-                            split = self.split_line(f, cutouts, start, end, verbose)
-        if split:
-            return i+1
-        else:
-            f.write(lines[i].to_gerber(self.settings) + '\n')
-            return i
+                        split = self.split_line(f, cutouts, start, end, verbose)
+        if not split:
+            f.write(start.to_gerber(self.settings) + '\n')
+        return split
 
     # can handle only horizontal lines, and lines going from left to right (i.e. start.x < end.x)
+    #
+    # a single pass over the statements, looking one statement ahead
+    # (the end statement of a split line is written again as the start of the next segment)
     def process_statements(self, f, statements, cutouts, verbose=False):
         if verbose:
             print('>>>>>>>>>>> process_statements')
             print('>>>>>>>>>>> cutouts: {}'.format(cutouts))
-        statements_list = []
+        index = CutoutIndex(cutouts, AppSettings.merge_error)
+        start = None
         for statement in statements:
-            statements_list.append(statement)
-        for i in range(len(statements_list)):
-            i = self.process_segment(f, i, statements_list, cutouts, verbose)
+            if start is not None:
+                self.process_segment(f, start, statement, index, verbose)
+            start = statement
+        if start is not None:
+            self.process_segment(f, start, None, index, verbose)
 
     def dump(self, path):
         def statements():
@@ -131,10 +174,9 @@ class SplitGerberComposition(GerberComposition):
             yield EofStmt()
         self.settings.notation = 'absolute'
         self.settings.zeros = 'trailing'
-        with open(path, 'w') as f:
+        with chunked_writer(path) as f:
             hm_gerber_ex.rs274x.write_gerber_header(f, self.settings)
             if self.cutout_lines is not None:
                 self.process_statements(f, statements(), self.cutout_lines, verbose=False)
             else:
-                for statement in statements():
-                    f.write(statement.to_gerber(self.settings) + '\n')
+                f.write_lines(statements_to_gerber(statements(), self.settings))
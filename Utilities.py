@@ -30,11 +30,6 @@ import zipfile
 from os.path import join
 from typing import Final
 
-import kivy
-from kivy.base import EventLoop
-from kivy.graphics import Fbo, ClearColor, ClearBuffers, Color, Rectangle
-from kivy.uix.image import Image
-
 from math import floor, ceil
 
 import Constants
@@ -93,7 +88,11 @@ def unzip_file(dst_folder, src_zip):
                 shutil.copyfileobj(source, target)
 
 
+# kivy is only imported by the functions that need it, so that the rest of the utilities
+# (and the panel export) can be used without it (ex. by do_panelize.py)
 def redraw_window():
+    import kivy.core.window
+    from kivy.base import EventLoop
     kivy.core.window.Window.canvas.ask_update()
     EventLoop.idle()
 
@@ -124,6 +123,7 @@ def is_desktop():
 
 
 def load_image(path, name):
+    from kivy.uix.image import Image
     full_path = os.path.join(path, name)
     image = None
     if os.path.isfile(full_path):
@@ -134,6 +134,22 @@ def load_image(path, name):
     return image
 
 
+# buffer is a (width, height, data) raster, as returned by GerberCairoContext.dump_buffer
+def image_from_buffer(buffer):
+    from kivy.graphics.texture import Texture
+    from kivy.uix.image import Image
+    image = None
+    if buffer is not None:
+        width, height, data = buffer
+        texture = Texture.create(size=(width, height), colorfmt='rgba')
+        # cairo ARGB32 pixels are BGRA in memory, and the rows start from the top
+        texture.blit_buffer(data, colorfmt='bgra', bufferfmt='ubyte')
+        texture.flip_vertical()
+        image = Image(size=(width, height))
+        image.texture = texture
+    return image
+
+
 def load_image_masked(path, name, color):
     image = load_image(path, name)
     if image is not None:
@@ -198,6 +214,8 @@ void main(void) {
 
 
 def colored_mask(mask, color):
+    from kivy.graphics import Fbo, ClearColor, ClearBuffers, Color, Rectangle
+    from kivy.uix.image import Image
     image = None
     if mask is not None:
         image = Image()
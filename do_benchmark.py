@@ -0,0 +1,453 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# The MIT License (MIT)
+
+# Copyright 2021,2022 HalfMarble LLC
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import sys
+import copy
+import math
+import time
+import random
+import tempfile
+import tracemalloc
+
+sys.path.append('.')
+
+import hm_gerber_ex
+from hm_gerber_ex import GerberComposition
+from hm_gerber_ex.utility import chunked_writer
+from hm_gerber_tool.cam import FileSettings
+from hm_gerber_tool.excellon import ExcellonParser, detect_excellon_format
+from hm_gerber_tool.layer_cache import LayerCache
+from hm_gerber_tool.layers import PCBLayer
+from hm_gerber_tool.pcb import PCB
+from hm_gerber_tool.gerber_statements import ADParamStmt, ApertureStmt, CoordStmt, EofStmt
+from hm_gerber_tool.primitives import Circle, Line, Rectangle
+from hm_gerber_tool.render import GerberCairoContext, theme
+from hm_gerber_tool.rs274x import GerberParser, loads
+from hm_gerber_tool.utils import detect_file_format, parse_gerber_value, write_gerber_value, write_gerber_values
+
+
+# micro-benchmarks of hm-panelizer hot paths, run with: python do_benchmark.py
+
+
+def benchmark(name, function, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    print(' {:<40} {:8.3f}s'.format(name, best))
+    return best
+
+
+def generate_composition(count):
+    settings = FileSettings(format=(4, 6), units='metric', notation='absolute', zeros='trailing')
+    ctx = GerberComposition(settings)
+    aperture = ADParamStmt('AD', 10, 'C', '0.25')
+    aperture.units = 'metric'
+    ctx.apertures.append(aperture)
+    ctx.drawings.append(ApertureStmt(10))
+    for i in range(count):
+        x = (i % 1000) * 0.127
+        y = (i // 1000) * 0.127
+        ctx.drawings.append(CoordStmt(None, x, y, None, None, 'D02' if i % 2 == 0 else 'D01', settings))
+    return ctx
+
+
+# the dump path before the chunked writer: a text file and one write per statement
+def dump_per_statement(ctx, path):
+    def statements():
+        for k in ctx.aperture_macros:
+            yield ctx.aperture_macros[k]
+        for s in ctx.apertures:
+            yield s
+        for s in ctx.drawings:
+            yield s
+        yield EofStmt()
+    ctx.settings.notation = 'absolute'
+    ctx.settings.zeros = 'trailing'
+    with open(path, 'w', newline='\n') as f:
+        hm_gerber_ex.rs274x.write_gerber_header(f, ctx.settings)
+        for statement in statements():
+            f.write(statement.to_gerber(ctx.settings) + '\n')
+
+
+def benchmark_dump(count=200000):
+    print('\nGerberComposition.dump ({} statements):'.format(count))
+    ctx = generate_composition(count)
+    with tempfile.TemporaryDirectory() as directory:
+        old_path = os.path.join(directory, 'per_statement.gbr')
+        new_path = os.path.join(directory, 'chunked.gbr')
+        old = benchmark('per statement write', lambda: dump_per_statement(ctx, old_path))
+        new = benchmark('chunked write', lambda: ctx.dump(new_path))
+        with open(old_path, 'rb') as f:
+            old_data = f.read()
+        with open(new_path, 'rb') as f:
+            new_data = f.read()
+        print(' identical output: {}, speedup: {:.2f}x'.format(old_data == new_data, old / new))
+
+        # the writing alone, without the statement formatting
+        lines = [statement.to_gerber(ctx.settings) for statement in ctx.drawings]
+
+        def write_per_line():
+            with open(old_path, 'w', newline='\n') as f:
+                for line in lines:
+                    f.write(line + '\n')
+
+        def write_chunked():
+            with chunked_writer(new_path) as f:
+                f.write_lines(iter(lines))
+
+        old = benchmark('per statement write (formatted lines)', write_per_line)
+        new = benchmark('chunked write (formatted lines)', write_chunked)
+        print(' speedup: {:.2f}x'.format(old / new))
+
+
+# a large copper like layer, with a header, comments, apertures and arcs
+def generate_gerber_data(count):
+    lines = ['G04 generated by do_benchmark.py*',
+             '%FSLAX46Y46*%',
+             '%MOMM*%',
+             '%LPD*%',
+             '%ADD10C,0.250000*%',
+             '%ADD11R,1.000000X1.500000*%',
+             '%AMRoundRect*',
+             '0 Rectangle with rounded corners*',
+             '21,1,$1,$2,0,0,$5*%',
+             'G01*',
+             'D10*']
+    for i in range(count):
+        x = (i % 1000) * 127000
+        y = (i // 1000) * 127000
+        if i % 100 == 0:
+            lines.append('D11*')
+            lines.append('X{}Y{}D03*'.format(x, y))
+            lines.append('D10*')
+        elif i % 10 == 0:
+            lines.append('G75*')
+            lines.append('G03X{}Y{}I63500J0D01*'.format(x, y))
+            lines.append('G01*')
+        else:
+            lines.append('X{}Y{}D0{}*'.format(x, y, 2 if i % 2 == 0 else 1))
+    lines.append('M02*')
+    return '\n'.join(lines) + '\n'
+
+
+# the command split before the token scanner: one character at a time
+def split_commands_per_character(data):
+    length = len(data)
+    start = 0
+    in_header = True
+    for cur in range(0, length):
+        val = data[cur]
+        if val == '%' and start == cur:
+            in_header = True
+            continue
+        if val == '\r' or val == '\n':
+            if start != cur:
+                yield data[start:cur]
+            start = cur + 1
+        elif not in_header and val == '*':
+            yield data[start:cur + 1]
+            start = cur + 1
+        elif in_header and val == '%':
+            yield data[start:cur + 1]
+            start = cur + 1
+            in_header = False
+
+
+def benchmark_split_commands(count=1000000):
+    data = generate_gerber_data(count)
+    print('\nGerberParser._split_commands ({:.1f} MB):'.format(len(data) / (1024 * 1024)))
+    parser = GerberParser()
+    old = benchmark('per character', lambda: list(split_commands_per_character(data)))
+    new = benchmark('token scanner', lambda: list(parser._split_commands(data)))
+    identical = list(split_commands_per_character(data)) == list(parser._split_commands(data))
+    print(' identical commands: {}, speedup: {:.2f}x'.format(identical, old / new))
+
+
+# the %SF and %OF parameters must still scale and offset the exported coordinates
+def check_scale_offset():
+    data = '\n'.join(['%FSLAX36Y36*%', '%MOMM*%', '%SFA1.5B2.0*%', '%OFA0.5B0.25*%',
+                      '%ADD10C,0.1*%', 'D10*', 'X1000000Y1000000D02*', 'X2000000Y1000000D01*', 'M02*']) + '\n'
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'scaled.gbr')
+        hm_gerber_ex.loads(data, path).write(path)
+        with open(path, 'r') as f:
+            coordinates = [line for line in f.read().split('\n') if line.startswith('X')]
+    print('\n%SF/%OF parameters:')
+    print(' exported coordinates: {}'.format(coordinates))
+    assert coordinates == ['X2000000Y2250000D02*', 'X3500000Y2250000D01*'], 'the %SF/%OF parameters were ignored'
+
+
+# the flash before the flyweight primitives: a deep copy of the aperture per D03
+def flash_deepcopy(aperture, position, level_polarity, units):
+    primitive = copy.deepcopy(aperture)
+    primitive.position = position
+    primitive.level_polarity = level_polarity
+    primitive.units = units
+    return primitive
+
+
+def benchmark_flash(count=100000):
+    print('\nD03 flashes ({} pads):'.format(count))
+    apertures = [Circle(position=None, diameter=0.5, hole_diameter=0, units='metric'),
+                 Rectangle(position=None, width=1.0, height=1.5, hole_diameter=0, units='metric')]
+    positions = [((i % 1000) * 0.127, (i // 1000) * 0.127) for i in range(count)]
+
+    def flash(function):
+        return [function(apertures[i % 2], position, 'dark', 'metric') for i, position in enumerate(positions)]
+
+    old = benchmark('deepcopy', lambda: flash(flash_deepcopy))
+    new = benchmark('flash', lambda: flash(lambda a, p, l, u: a.flash(p, l, u)))
+    identical = [p.bounding_box for p in flash(flash_deepcopy)] == \
+                [p.bounding_box for p in flash(lambda a, p, l, u: a.flash(p, l, u))]
+    print(' identical bounding boxes: {}, speedup: {:.2f}x'.format(identical, old / new))
+
+
+# the value conversions before the integer fast path and the memoization: a list of digit characters
+def parse_gerber_value_digits(value, format=(4, 6), zero_suppression='trailing'):
+    if '.' in value:
+        return float(value)
+    integer_digits, decimal_digits = format
+    value = value.lstrip('+')
+    negative = '-' in value
+    if negative:
+        value = value.lstrip('-')
+    missing_digits = integer_digits + decimal_digits - len(value)
+    if zero_suppression == 'trailing':
+        digits = list(value + ('0' * missing_digits))
+    elif zero_suppression == 'leading':
+        digits = list(('0' * missing_digits) + value)
+    else:
+        digits = list(value)
+    result = float(''.join(digits[:integer_digits] + ['.'] + digits[integer_digits:]))
+    return -result if negative else result
+
+
+def write_gerber_value_digits(value, format=(4, 6), zero_suppression='trailing'):
+    integer_digits, decimal_digits = format
+    if value == 0.0:
+        return '0'
+    negative = value < 0.0
+    if negative:
+        value = -1.0 * value
+    fmtstring = '%%0%d.0%df' % (integer_digits + decimal_digits + 1, decimal_digits)
+    digits = [val for val in fmtstring % value if val != '.']
+    if sum([int(digit) for digit in digits]) == 0:
+        return '0'
+    if zero_suppression == 'trailing':
+        while digits and digits[-1] == '0':
+            digits.pop()
+    elif zero_suppression == 'leading':
+        while digits and digits[0] == '0':
+            digits.pop(0)
+    if not digits:
+        return '0'
+    return ''.join(digits) if not negative else ''.join(['-'] + digits)
+
+
+def benchmark_gerber_values(count=1000000):
+    print('\nGerber values ({} coordinates):'.format(count))
+    # grid snapped coordinates, like the ones of a real layer
+    values = [((i * 7919) % 4000 - 2000) * 0.0254 for i in range(count)]
+    strings = [write_gerber_value_digits(value, (4, 6), 'leading') for value in values]
+
+    old = benchmark('parse digit characters', lambda: [parse_gerber_value_digits(s, (4, 6), 'leading') for s in strings])
+    new = benchmark('parse integer', lambda: [parse_gerber_value(s, (4, 6), 'leading') for s in strings])
+    identical = [parse_gerber_value_digits(s, (4, 6), 'leading') for s in strings] == \
+                [parse_gerber_value(s, (4, 6), 'leading') for s in strings]
+    print(' identical values: {}, speedup: {:.2f}x'.format(identical, old / new))
+
+    old = benchmark('write digit characters', lambda: [write_gerber_value_digits(v, (4, 6), 'leading') for v in values])
+    new = benchmark('write', lambda: [write_gerber_value(v, (4, 6), 'leading') for v in values])
+    batch = benchmark('write batch', lambda: write_gerber_values(values, (4, 6), 'leading'))
+    identical = strings == [write_gerber_value(v, (4, 6), 'leading') for v in values] == \
+                write_gerber_values(values, (4, 6), 'leading')
+    print(' identical strings: {}, speedup: {:.2f}x, batch: {:.2f}x'.format(identical, old / new, old / batch))
+
+
+def benchmark_statements_only(count=200000):
+    data = generate_gerber_data(count)
+    print('\nGerber parse ({:.1f} MB):'.format(len(data) / (1024 * 1024)))
+    old = benchmark('statements and primitives', lambda: loads(data, 'benchmark.gtl'), repeat=1)
+    new = benchmark('statements only', lambda: loads(data, 'benchmark.gtl', statements_only=True), repeat=1)
+
+    def memory(statements_only):
+        tracemalloc.start()
+        file = loads(data, 'benchmark.gtl', statements_only=statements_only)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size
+
+    print(' speedup: {:.2f}x, memory: {:.1f} MB -> {:.1f} MB'.format(
+        old / new, memory(False) / (1024 * 1024), memory(True) / (1024 * 1024)))
+
+
+# a routed drill file, without the units (and zeros) statement, so that every format option is scored
+def generate_drill_data(count):
+    lines = ['M48', 'T1C0.800', 'T2C1.000', 'T3C3.000', '%', 'G90', 'G05']
+    for i in range(count):
+        x = (i % 1000) * 1270
+        y = (i // 1000) * 1270
+        if i % 1000 == 0:
+            lines.append('T{}'.format(1 + (i // 1000) % 2))
+        lines.append('X{}Y{}'.format(x, y))
+    lines.extend(['T3', 'G00X0Y0', 'M15', 'G01X1000000Y0', 'G01X1000000Y500000', 'M16', 'G05', 'T0', 'M30'])
+    return '\n'.join(lines) + '\n'
+
+
+# the detection before the tokens: a parse of the whole file for every option
+def detect_excellon_format_reparse(data):
+    p = ExcellonParser()
+    p.parse_raw(data)
+    results = {}
+    for zeros in ('leading', 'trailing'):
+        for fmt in ((2, 4), (2, 5), (3, 3)):
+            try:
+                p = ExcellonParser(FileSettings(zeros=zeros, format=fmt))
+                ef = p.parse_raw(data)
+                size = tuple([t[0] - t[1] for t in ef.bounding_box])
+                hole_area = 0.0
+                for hit in p.hits:
+                    hole_area += math.pow(math.pi * hit.tool.diameter / 2., 2)
+                results[(fmt, zeros)] = (size, p.hole_count, hole_area)
+            except:
+                pass
+    return results
+
+
+def benchmark_detect_excellon_format(count=50000):
+    data = generate_drill_data(count)
+    print('\ndetect_excellon_format ({} holes):'.format(count))
+    old = benchmark('parse per option', lambda: detect_excellon_format_reparse(data), repeat=1)
+    new = benchmark('tokens', lambda: detect_excellon_format(data), repeat=1)
+    print(' detected: {}, speedup: {:.2f}x'.format(detect_excellon_format(data), old / new))
+
+
+def benchmark_layer_cache(count=50000):
+    with tempfile.TemporaryDirectory() as board_path, tempfile.TemporaryDirectory() as cache_path:
+        with open(os.path.join(board_path, 'benchmark.gtl'), 'w') as f:
+            f.write(generate_gerber_data(count))
+        with open(os.path.join(board_path, 'benchmark-PTH.drl'), 'w') as f:
+            f.write(generate_drill_data(count))
+        cache = LayerCache(cache_path)
+        print('\nPCB.from_directory ({} statements, {} holes):'.format(count, count))
+        old = benchmark('parse', lambda: PCB.from_directory(board_path, cache=False), repeat=1)
+        PCB.from_directory(board_path, cache=cache)
+        new = benchmark('cached', lambda: PCB.from_directory(board_path, cache=cache), repeat=1)
+        print(' speedup: {:.2f}x'.format(old / new))
+
+
+# the detection before the marker regex: every line of the file is split
+def detect_file_format_split(data):
+    lines = data.split('\n')
+    for line in lines:
+        if 'M48' in line:
+            return 'excellon'
+        elif '%FS' in line:
+            return 'rs274x'
+        elif ((len(line.split()) >= 2) and
+              (line.split()[0] == 'P') and (line.split()[1] == 'JOB')):
+            return 'ipc_d_356'
+    return 'unknown'
+
+
+def benchmark_detect_file_format(count=200000):
+    # the worst case, a file without any marker
+    data = generate_gerber_data(count).replace('%FS', '%XX')
+    print('\ndetect_file_format ({:.1f} MB, no marker):'.format(len(data) / (1024 * 1024)))
+    old = benchmark('split lines', lambda: detect_file_format_split(data))
+    new = benchmark('bounded regex', lambda: detect_file_format(data))
+    print(' detected: {}, speedup: {:.2f}x'.format(detect_file_format(data), old / new))
+
+
+def benchmark_render(count=50000, resolution=2048):
+    layer = PCBLayer.from_cam(loads(generate_gerber_data(count), 'benchmark.gtl'))
+    print('\nrender_clipped_layer ({} primitives, {} px):'.format(len(layer.primitives), resolution))
+    with tempfile.TemporaryDirectory() as path:
+        filename = os.path.join(path, 'benchmark')
+
+        def render(svg):
+            ctx = GerberCairoContext(resolution, svg=svg)
+            ctx.render_clipped_layer(layer, False, filename, theme.THEMES['Mask'], bounds=layer.bounds,
+                                     background=False)
+
+        old = benchmark('svg surfaces', lambda: render(True), repeat=1)
+        new = benchmark('image surfaces', lambda: render(False), repeat=1)
+        print(' speedup: {:.2f}x'.format(old / new))
+
+
+def benchmark_batched_render(count=200000, resolution=2048):
+    layer = PCBLayer.from_cam(loads(generate_gerber_data(count), 'benchmark.gtl'))
+    print('\nrender_layer ({} primitives, {} px):'.format(len(layer.primitives), resolution))
+
+    def render(batch):
+        ctx = GerberCairoContext(resolution, batch=batch)
+        ctx.render_layer(layer, background=False)
+
+    old = benchmark('stroke per primitive', lambda: render(False), repeat=1)
+    new = benchmark('stroke per batch', lambda: render(True), repeat=1)
+    print(' speedup: {:.2f}x'.format(old / new))
+
+
+# a castellated outline of many tiny segments, shuffled like the ones of an exported edge cuts layer
+def generate_outline_segments(count):
+    aperture = Circle((0, 0), 0.1)
+    points = [(i * 0.05, (i % 2) * 0.05) for i in range(count)]
+    segments = [Line(points[i], points[i + 1], aperture) for i in range(count - 1)]
+    segments.append(Line(points[-1], (points[-1][0], 5.0), aperture))
+    segments.append(Line((points[-1][0], 5.0), (0.0, 5.0), aperture))
+    segments.append(Line((0.0, 5.0), points[0], aperture))
+    random.Random(1).shuffle(segments)
+    return segments
+
+
+def benchmark_outline_segments(count=20000):
+    print('\n_get_outline_segments (linear, the time should scale with the segments):')
+    ctx = GerberCairoContext()
+    small = generate_outline_segments(count // 8)
+    large = generate_outline_segments(count)
+    old = benchmark('{} segments'.format(len(small)), lambda: ctx._get_outline_segments(list(small), False))
+    new = benchmark('{} segments'.format(len(large)), lambda: ctx._get_outline_segments(list(large), False))
+    print(' time ratio: {:.2f} for {:.2f}x the segments'.format(new / old, len(large) / len(small)))
+
+
+if __name__ == '__main__':
+    benchmark_dump()
+    benchmark_split_commands()
+    check_scale_offset()
+    benchmark_flash()
+    benchmark_gerber_values()
+    benchmark_statements_only()
+    benchmark_detect_excellon_format()
+    benchmark_layer_cache()
+    benchmark_detect_file_format()
+    benchmark_render()
+    benchmark_outline_segments()
+    benchmark_batched_render()
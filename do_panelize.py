@@ -0,0 +1,243 @@
+# The MIT License (MIT)
+
+# Copyright 2021,2022 HalfMarble LLC
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.append('.')
+
+from hm_gerber_tool import PCB
+
+from AppSettings import *
+from Constants import *
+from PcbExport import *
+from PcbFile import *
+from PcbPanelLayout import *
+from Utilities import *
+
+
+# headless (no kivy) batch panelization, ex:
+#
+# python -m do_panelize --preset jlc --columns 2 --rows 3 --angle 90 --output panels board1.zip board2
+#
+# or, with per board settings (any of the command line settings can be overridden per job):
+#
+# python -m do_panelize --jobs jobs.json --workers 8
+#
+# [
+#   {"input": "board1.zip", "output": "panels/board1", "columns": 2, "rows": 3},
+#   {"input": "board2", "output": "panels/board2", "preset": "oshpark", "angle": 90}
+# ]
+
+
+# (gap, rail, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, use_step_repeat), see main.py
+presets = {
+    'default': (PCB_PANEL_GAP_MM, PCB_PANEL_RAIL_HEIGHT_MM, PCB_PANEL_BITES_SIZE_MM,
+                PCB_BITES_HOLE_RADIUS_MM, PCB_BITES_HOLE_SPACE_MM,
+                PCB_PANEL_USE_VCUT, PCB_PANEL_USE_JLC, PCB_PANEL_USE_STEP_REPEAT),
+    'oshpark': (OSHPARK_PCB_PANEL_GAP_MM, OSHPARK_PCB_PANEL_RAIL_HEIGHT_MM, OSHPARK_PCB_PANEL_BITES_SIZE_MM,
+                OSHPARK_PCB_BITES_HOLE_RADIUS_MM, OSHPARK_PCB_BITES_HOLE_SPACE_MM,
+                OSHPARK_PCB_PANEL_VCUT, False, OSHPARK_PCB_PANEL_STEP_REPEAT),
+    'jlc': (JLC_PCB_PANEL_GAP_MM, JLC_PCB_PANEL_RAIL_HEIGHT_MM, JLC_PCB_PANEL_BITES_SIZE_MM,
+            JLC_PCB_BITES_HOLE_RADIUS_MM, JLC_PCB_BITES_HOLE_SPACE_MM,
+            JLC_PCB_PANEL_VCUT, True, JLC_PCB_PANEL_STEP_REPEAT),
+    'pcbway': (PCBWAY_PCB_PANEL_GAP_MM, PCBWAY_PCB_PANEL_RAIL_HEIGHT_MM, PCBWAY_PCB_PANEL_BITES_SIZE_MM,
+               PCBWAY_PCB_BITES_HOLE_RADIUS_MM, PCBWAY_PCB_BITES_HOLE_SPACE_MM,
+               PCBWAY_PCB_PANEL_VCUT, False, PCBWAY_PCB_PANEL_STEP_REPEAT),
+}
+
+job_defaults = {
+    'output': None,
+    'columns': INITIAL_COLUMNS,
+    'rows': INITIAL_ROWS,
+    'angle': 0.0,
+    'bites': PCB_PANEL_BITES_COUNT_X,
+    'preset': 'default',
+    'merge_error': PCB_PANEL_MERGE_ERROR,
+}
+
+
+def apply_preset(preset, bites_count, merge_error):
+    if preset not in presets:
+        raise ValueError('unknown preset \"{}\" (available: {})'.format(preset, ', '.join(presets)))
+    gap, rail, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, use_step_repeat = presets[preset]
+    AppSettings.set(gap, rail, bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error,
+                    use_step_repeat)
+
+
+# the same origin and size that Pcb gets from the outline (see GerberCairoContext.get_outline_mask)
+def get_pcb_rect_mm(pcb):
+    bounds = pcb.board_bounds
+    metric = True
+    for layer in pcb.layers:
+        if layer.bounds == bounds:
+            metric = layer.metric
+            break
+    scale = 1.0 if metric else 25.4
+    min_x = scale * bounds[0][0]
+    min_y = scale * bounds[1][0]
+    width = (scale * bounds[0][1]) - min_x
+    height = (scale * bounds[1][1]) - min_y
+    return (min_x, min_y), (width, height)
+
+
+def panelize(pcb_path, panel_path, columns, rows, angle, workers=1):
+    pcb = PCB.from_directory(pcb_path, workers=workers)
+    if pcb is None:
+        return 'No PCB found in \"{}\"'.format(pcb_path)
+    pcb_rect_mm = get_pcb_rect_mm(pcb)
+    pcb_width_mm = pcb_rect_mm[1][0]
+    pcb_height_mm = pcb_rect_mm[1][1]
+
+    panel_width_mm, panel_height_mm = get_panel_size_mm(pcb_width_mm, pcb_height_mm, columns, rows, angle)
+
+    with tempfile.TemporaryDirectory() as rail_path, tempfile.TemporaryDirectory() as mouse_bite_path:
+        # see PcbRail.generate_pcb_files()
+        origin = (0, 0)
+        size = (panel_width_mm, AppSettings.rail)
+        save_rail_gm1(rail_path, origin, size, columns, AppSettings.gap, AppSettings.use_vcut)
+        save_rail_gtl(rail_path, origin, size)
+        save_rail_gts(rail_path, origin, size)
+        save_rail_gto(rail_path, origin, size, columns, AppSettings.gap, AppSettings.use_vcut, AppSettings.use_jlc)
+        save_rail_gbo(rail_path, origin, size)
+
+        # see PcbMouseBites.generate_pcb_files()
+        size = (AppSettings.bite, AppSettings.gap)
+        save_mouse_bite_gm1(mouse_bite_path, origin, size, arc=PCB_BITES_ARC_MM, close=False)
+        save_mouse_bite_drl(mouse_bite_path, origin, size, AppSettings.bite_hole_radius, AppSettings.bite_hole_space)
+
+        row_mouse_bites_xs = get_row_mouse_bites_xs(pcb_width_mm, pcb_height_mm, angle, AppSettings.bites_count)
+        rail_origins = get_rails_origins(pcb_width_mm, pcb_height_mm, rows, angle)
+        pcb_origins = get_pcbs_origins(pcb_width_mm, pcb_height_mm, columns, rows, angle)
+        mouse_bite_origins = get_mouse_bites_origins(pcb_width_mm, pcb_height_mm, columns, rows, angle,
+                                                     row_mouse_bites_xs)
+
+        if not os.path.exists(panel_path):
+            os.makedirs(panel_path)
+
+        return export_pcb_panel(None, panel_path,
+                                pcb_path, pcb_origins, pcb_rect_mm,
+                                rail_path, rail_origins,
+                                mouse_bite_path, mouse_bite_origins, AppSettings.bite, AppSettings.gap,
+                                angle, verbose=False, workers=workers, step_repeat=AppSettings.use_step_repeat)
+
+
+# runs a single job, returns an error message, or None
+def run_job(job, workers=1):
+    try:
+        apply_preset(job['preset'], job['bites'], job['merge_error'])
+        path = job['input']
+        if os.path.splitext(path)[1].lower() == '.zip':
+            with tempfile.TemporaryDirectory() as pcb_path:
+                unzip_file(pcb_path, path)
+                return panelize(pcb_path, job['output'], job['columns'], job['rows'], job['angle'], workers)
+        elif os.path.isdir(path):
+            return panelize(path, job['output'], job['columns'], job['rows'], job['angle'], workers)
+        else:
+            return '\"{}\" is neither a directory, nor a zip file'.format(path)
+    except Exception as e:
+        return 'ERROR: {}'.format(e)
+
+
+def make_job(settings, overrides):
+    job = dict(settings)
+    job.update(overrides)
+    if job['output'] is None:
+        name = os.path.splitext(os.path.basename(os.path.normpath(job['input'])))[0]
+        job['output'] = os.path.join('.', '{}_panel'.format(name))
+    return job
+
+
+def report(job, error_msg):
+    if error_msg is not None:
+        print('FAILED: {} ({})'.format(job['input'], error_msg))
+        return 1
+    else:
+        print('DONE: {} -> {}'.format(job['input'], job['output']))
+        return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m do_panelize', description='{} headless batch panelization'
+                                     .format(APP_NAME))
+    parser.add_argument('inputs', nargs='*', help='gerber directories, or zip files')
+    parser.add_argument('--jobs', help='json file with a list of jobs (dictionaries with "input" and any of the '
+                                       'settings below, which override the command line ones)')
+    parser.add_argument('--output', help='output directory (the panels go into its subdirectories, '
+                                         'when there is more than one input)')
+    parser.add_argument('--columns', type=int, default=job_defaults['columns'])
+    parser.add_argument('--rows', type=int, default=job_defaults['rows'])
+    parser.add_argument('--angle', type=float, default=job_defaults['angle'], choices=[0.0, 90.0])
+    parser.add_argument('--bites', type=int, default=job_defaults['bites'], help='mouse bites per pcb')
+    parser.add_argument('--preset', default=job_defaults['preset'], choices=list(presets))
+    parser.add_argument('--merge-error', type=float, default=job_defaults['merge_error'])
+    parser.add_argument('--workers', type=int, default=PCB_PANEL_EXPORT_WORKERS,
+                        help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    settings = dict(job_defaults)
+    settings['columns'] = clamp(1, args.columns, MAX_COLUMNS)
+    settings['rows'] = clamp(1, args.rows, MAX_ROWS)
+    settings['angle'] = args.angle
+    settings['bites'] = args.bites
+    settings['preset'] = args.preset
+    settings['merge_error'] = args.merge_error
+
+    jobs = []
+    for path in args.inputs:
+        output = args.output
+        if output is not None and (len(args.inputs) > 1 or args.jobs is not None):
+            name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+            output = os.path.join(output, name)
+        jobs.append(make_job(settings, {'input': path, 'output': output}))
+    if args.jobs is not None:
+        with open(args.jobs) as f:
+            for overrides in json.load(f):
+                jobs.append(make_job(settings, overrides))
+    if len(jobs) == 0:
+        parser.error('nothing to panelize')
+
+    failed = 0
+    if len(jobs) == 1 or args.workers <= 1:
+        # a single job exports its layers in parallel instead
+        for job in jobs:
+            error_msg = run_job(job, args.workers if len(jobs) == 1 else 1)
+            failed += report(job, error_msg)
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {executor.submit(run_job, job): job for job in jobs}
+            for future in as_completed(futures):
+                failed += report(futures[future], future.result())
+
+    print('panelized {} of {} boards'.format(len(jobs) - failed, len(jobs)))
+    return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
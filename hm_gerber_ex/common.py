@@ -7,7 +7,7 @@
 import os
 from hm_gerber_tool.common import loads as loads_org
 from hm_gerber_tool.exceptions import ParseError
-from hm_gerber_tool.utils import detect_file_format
+from hm_gerber_tool.utils import detect_file_format, read_file_format
 import hm_gerber_tool.rs274x
 import hm_gerber_tool.ipc356
 import hm_gerber_ex.rs274x
@@ -15,19 +15,21 @@ import hm_gerber_ex.excellon
 #import hm_gerber_ex.dxf
 
 
-def read(filename, format=None):
-    with open(filename, 'rU') as f:
-        data = f.read()
-    return loads(data, filename, format=format)
+# statements_only skips building the primitives of rs274x files (see hm_gerber_tool.rs274x.GerberParser),
+# they are built on first access
+def read(filename, format=None, statements_only=False):
+    file_format, data = read_file_format(filename)
+    return loads(data, filename, format=format, statements_only=statements_only, file_format=file_format)
 
 
-def loads(data, filename=None, format=None):
+# file_format skips the format detection, if it is already known (see hm_gerber_tool.utils.read_file_format)
+def loads(data, filename=None, format=None, statements_only=False, file_format=None):
     if os.path.splitext(filename if filename else '')[1].lower() == '.dxf':
         return hm_gerber_ex.dxf.loads(data, filename)
 
-    fmt = detect_file_format(data)
+    fmt = file_format if file_format is not None else detect_file_format(data)
     if fmt == 'rs274x':
-        file = hm_gerber_ex.rs274x.loads(data, filename=filename)
+        file = hm_gerber_ex.rs274x.loads(data, filename=filename, statements_only=statements_only)
         return hm_gerber_ex.rs274x.GerberFile.from_gerber_file(file)
     elif fmt == 'excellon':
         return hm_gerber_ex.excellon.loads(data, filename=filename, format=format)
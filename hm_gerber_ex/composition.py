@@ -5,11 +5,11 @@
 # Copyright 2019 Hiroshi Murayama <opiopan@gmail.com>
 
 import os
-from functools import reduce
 
 import hm_gerber_ex
+from hm_gerber_ex.utility import chunked_writer
 from hm_gerber_tool.cam import FileSettings
-from hm_gerber_tool.gerber_statements import EofStmt, CoordStmt, CommentStmt
+from hm_gerber_tool.gerber_statements import EofStmt, CoordStmt, CommentStmt, SRParamStmt, statements_to_gerber
 from hm_gerber_tool.excellon_statements import *
 from hm_gerber_tool.excellon import DrillSlot, DrillHit
 import hm_gerber_tool.rs274x
@@ -31,15 +31,19 @@ class GerberComposition(Composition):
         self.aperture_macros = {}
         self.apertures = []
         self.drawings = []
+        # identical macros and apertures of the merged files are registered only once
+        self._aperture_macro_index = {}
+        self._aperture_index = {}
 
-    def merge(self, file):
+    def merge(self, file, step_repeat=None):
         if isinstance(file, hm_gerber_ex.rs274x.GerberFile):
-            self._merge_gerber(file)
+            self._merge_gerber(file, step_repeat)
         elif isinstance(file, hm_gerber_ex.dxf.DxfFile):
             self._merge_dxf(file)
         else:
             raise Exception('unsupported file type')
 
+    # path is either a path, or any binary file-like object
     def dump(self, path):
         def statements():
             for k in self.aperture_macros:
@@ -51,12 +55,13 @@ class GerberComposition(Composition):
             yield EofStmt()
         self.settings.notation = 'absolute'
         self.settings.zeros = 'trailing'
-        with open(path, 'w') as f:
+        with chunked_writer(path) as f:
             hm_gerber_ex.rs274x.write_gerber_header(f, self.settings)
-            for statement in statements():
-                f.write(statement.to_gerber(self.settings) + '\n')
+            f.write_lines(statements_to_gerber(statements(), self.settings))
 
-    def _merge_gerber(self, file):
+    # step_repeat: optional (x_repeat, y_repeat, x_step, y_step) tuple, in the file units,
+    # to emit the file once inside a %SR% block instead of once per copy
+    def _merge_gerber(self, file, step_repeat=None):
         aperture_macro_map = {}
         aperture_map = {}
 
@@ -80,11 +85,26 @@ class GerberComposition(Composition):
                 newdnum = self._register_aperture(statement)
                 aperture_map[dnum] = newdnum
 
+        if step_repeat is not None:
+            x_repeat, y_repeat, x_step, y_step = step_repeat
+            statement = SRParamStmt('SR', x_repeat, y_repeat, x_step, y_step)
+            statement.units = file.units
+            if self.settings is not None:
+                if self.settings.units == 'metric':
+                    statement.to_metric()
+                else:
+                    statement.to_inch()
+            self.drawings.append(statement)
+
+        file.sync_columns()
         for statement in file.main_statements:
             if statement.type == 'APERTURE':
                 statement.d = aperture_map[statement.d]
             self.drawings.append(statement)
-        
+
+        if step_repeat is not None:
+            self.drawings.append(SRParamStmt('SR'))
+
         if self.settings is None:
             self.settings = file.context
 
@@ -102,6 +122,10 @@ class GerberComposition(Composition):
             self.settings = file.settings
 
     def _register_aperture_macro(self, statement):
+        # the macro definition without its name
+        key = (statement.units, statement.to_gerber(self.settings).split('*', 1)[1])
+        if key in self._aperture_macro_index:
+            return self._aperture_macro_index[key]
         name = statement.name
         newname = name
         offset = 0
@@ -110,11 +134,16 @@ class GerberComposition(Composition):
             newname = '%s_%d' % (name, offset)
         statement.name = newname
         self.aperture_macros[newname] = statement
+        self._aperture_macro_index[key] = newname
         return newname
 
     def _register_aperture(self, statement):
+        key = (statement.shape, tuple(tuple(modifier) for modifier in statement.modifiers), statement.units)
+        if key in self._aperture_index:
+            return self._aperture_index[key]
         statement.d = len(self.apertures) + self.APERTURE_ID_BIAS
         self.apertures.append(statement)
+        self._aperture_index[key] = statement.d
         return statement.d
 
 
@@ -124,7 +153,11 @@ class DrillComposition(Composition):
         self.tools = []
         self.hits = []
         self.dxf_statements = []
-    
+        # registered tools by their equivalence key, and the hits and dxf statements by tool number
+        self._tool_index = {}
+        self._tool_hits = {}
+        self._tool_dxf_statements = {}
+
     def merge(self, file):
 
         if isinstance(file, hm_gerber_ex.excellon.ExcellonFileEx):
@@ -139,20 +172,16 @@ class DrillComposition(Composition):
             return
         def statements():
             for t in self.tools:
-                stmt = ToolSelectionStmt(t.number)
                 yield ToolSelectionStmt(t.number).to_excellon(self.settings)
-                for h in self.hits:
-                    if h.tool.number == t.number:
-                        yield h.to_excellon(self.settings)
-                for num, statement in self.dxf_statements:
-                    if num == t.number:
-                        yield statement.to_excellon(self.settings)
+                for h in self._tool_hits[t.number]:
+                    yield h.to_excellon(self.settings)
+                for statement in self._tool_dxf_statements[t.number]:
+                    yield statement.to_excellon(self.settings)
             yield EndOfProgramStmt().to_excellon()
 
-        with open(path, 'w') as f:
+        with chunked_writer(path) as f:
             hm_gerber_ex.excellon.write_excellon_header(f, self.settings, self.tools)
-            for statement in statements():
-                f.write(statement + '\n')
+            f.write_lines(statements())
 
     def _merge_excellon(self, file):
         tool_map = {}
@@ -171,6 +200,7 @@ class DrillComposition(Composition):
         for hit in file.hits:
             hit.tool = tool_map[hit.tool.number]
             self.hits.append(hit)
+            self._tool_hits[hit.tool.number].append(hit)
     
     def _merge_dxf(self, file):
         if self.settings is None:
@@ -182,17 +212,24 @@ class DrillComposition(Composition):
 
         tool = self._register_tool(ExcellonTool(self.settings, number=1, diameter=file.width))
         self.dxf_statements.append((tool.number, file.statements))
+        self._tool_dxf_statements[tool.number].append(file.statements)
+
+    # the same properties as ExcellonTool.equivalent() compares
+    @staticmethod
+    def _tool_key(tool):
+        return (type(tool), tool.diameter, tool.feed_rate, tool.retract_rate, tool.rpm, tool.depth_offset,
+                tool.max_hit_count, tool.plated, tool.settings.units)
 
     def _register_tool(self, tool):
-        for existing in self.tools:
-            if existing.equivalent(tool):
-                return existing
+        existing = self._tool_index.get(self._tool_key(tool))
+        if existing is not None:
+            return existing
         new_tool = ExcellonTool.from_tool(tool)
         new_tool.settings = self.settings
-        def toolnums():
-            for tool in self.tools:
-                yield tool.number
-        max_num = reduce(lambda x, y: x if x > y else y, toolnums(), 0)
-        new_tool.number = max_num + 1
+        # tools are only ever appended with increasing numbers, so the last one has the highest number
+        new_tool.number = self.tools[-1].number + 1 if len(self.tools) > 0 else 1
         self.tools.append(new_tool)
+        self._tool_index[self._tool_key(new_tool)] = new_tool
+        self._tool_hits[new_tool.number] = []
+        self._tool_dxf_statements[new_tool.number] = []
         return new_tool
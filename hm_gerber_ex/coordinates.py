@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2022 HalfMarble LLC
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from hm_gerber_tool.gerber_statements import CoordStmt
+from hm_gerber_tool.utils import inch, metric
+
+# the columns are vectorized with numpy, if it is installed,
+# otherwise they fall back to the (slower, but still contiguous) array module
+HAS_NUMPY = numpy is not None
+
+
+# columnar (x, y, i, j) view of the coordinate statements of a GerberFile, so that transforms and unit
+# conversions run over contiguous float64 columns, instead of over the statements one at a time
+#
+# the statements are only updated by sync(), which has to be called before they are serialized
+class CoordinateColumns(object):
+
+    def __init__(self, statements, units):
+        self.statements = [s for s in statements if self.is_column_statement(s)]
+        self.units = units
+        has_ij = [s.i is not None and s.j is not None for s in self.statements]
+        x = [s.x for s in self.statements]
+        y = [s.y for s in self.statements]
+        i = [s.i if ij else 0.0 for s, ij in zip(self.statements, has_ij)]
+        j = [s.j if ij else 0.0 for s, ij in zip(self.statements, has_ij)]
+        if HAS_NUMPY:
+            self.x = numpy.array(x, dtype=numpy.float64)
+            self.y = numpy.array(y, dtype=numpy.float64)
+            self.i = numpy.array(i, dtype=numpy.float64)
+            self.j = numpy.array(j, dtype=numpy.float64)
+            self.has_ij = numpy.array(has_ij, dtype=bool)
+        else:
+            self.x = array('d', x)
+            self.y = array('d', y)
+            self.i = array('d', i)
+            self.j = array('d', j)
+            self.has_ij = has_ij
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.statements)
+
+    # the statements kept in the columns
+    @staticmethod
+    def is_column_statement(statement):
+        return isinstance(statement, CoordStmt) and statement.x is not None and statement.y is not None
+
+    # a copy of the columns for copies of the statements (in the same order), which are only updated by sync()
+    def copy(self, statements):
+        columns = CoordinateColumns.__new__(CoordinateColumns)
+        columns.statements = statements
+        columns.units = self.units
+        if HAS_NUMPY:
+            columns.x = self.x.copy()
+            columns.y = self.y.copy()
+            columns.i = self.i.copy()
+            columns.j = self.j.copy()
+        else:
+            columns.x = array('d', self.x)
+            columns.y = array('d', self.y)
+            columns.i = array('d', self.i)
+            columns.j = array('d', self.j)
+        # never modified
+        columns.has_ij = self.has_ij
+        columns.dirty = self.dirty
+        return columns
+
+    # applies a 2D affine matrix (see hm_gerber_ex.utility), the i/j arc offsets get only its linear part
+    def transform(self, matrix):
+        a, b, c, d, e, f = matrix
+        if HAS_NUMPY:
+            x = self.x
+            y = self.y
+            self.x = a * x + b * y + c
+            self.y = d * x + e * y + f
+            i = self.i
+            j = self.j
+            self.i = a * i + b * j
+            self.j = d * i + e * j
+        else:
+            x = self.x
+            y = self.y
+            self.x = array('d', [a * xv + b * yv + c for xv, yv in zip(x, y)])
+            self.y = array('d', [d * xv + e * yv + f for xv, yv in zip(x, y)])
+            i = self.i
+            j = self.j
+            self.i = array('d', [a * iv + b * jv for iv, jv in zip(i, j)])
+            self.j = array('d', [d * iv + e * jv for iv, jv in zip(i, j)])
+        self.dirty = True
+
+    def to_inch(self):
+        if self.units == 'metric':
+            self._convert(inch)
+            self.units = 'inch'
+
+    def to_metric(self):
+        if self.units == 'inch':
+            self._convert(metric)
+            self.units = 'metric'
+
+    # inch() and metric() work on numpy arrays as well
+    def _convert(self, function):
+        if HAS_NUMPY:
+            self.x = function(self.x)
+            self.y = function(self.y)
+            self.i = function(self.i)
+            self.j = function(self.j)
+        else:
+            self.x = array('d', map(function, self.x))
+            self.y = array('d', map(function, self.y))
+            self.i = array('d', map(function, self.i))
+            self.j = array('d', map(function, self.j))
+        self.dirty = True
+
+    # writes the columns back into the statements
+    def sync(self):
+        if not self.dirty:
+            return
+        units = self.units
+        if HAS_NUMPY:
+            columns = zip(self.statements, self.x.tolist(), self.y.tolist(),
+                          self.i.tolist(), self.j.tolist(), self.has_ij.tolist())
+        else:
+            columns = zip(self.statements, self.x, self.y, self.i, self.j, self.has_ij)
+        for statement, x, y, i, j, has_ij in columns:
+            statement.x = x
+            statement.y = y
+            if has_ij:
+                statement.i = i
+                statement.j = j
+            if statement.units != units:
+                statement.units = units
+                if units == 'metric' and statement.function == 'G70':
+                    statement.function = 'G71'
+                elif units == 'inch' and statement.function == 'G71':
+                    statement.function = 'G70'
+        self.dirty = False
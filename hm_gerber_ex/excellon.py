@@ -4,6 +4,7 @@
 # Copyright 2022 HalfMarble LLC
 # Copyright 2019 Hiroshi Murayama <opiopan@gmail.com>
 
+import copy
 import operator
 
 import hm_gerber_tool.excellon
@@ -15,7 +16,7 @@ from hm_gerber_tool.excellon_statements import ExcellonStatement, UnitStmt, Coor
                                        EndOfProgramStmt
 from hm_gerber_tool.cam import FileSettings
 from hm_gerber_tool.utils import inch, metric, write_gerber_value, parse_gerber_value
-from hm_gerber_ex.utility import rotate
+from hm_gerber_ex.utility import rotate, transform_point, transform_vector, shallow_copy
 
 
 def loads(data, filename=None, settings=None, tools=None, format=None):
@@ -181,11 +182,35 @@ class ExcellonFileEx(ExcellonFile):
     def __init__(self, statements, tools, hits, settings, filename=None):
         super(ExcellonFileEx, self).__init__(statements, tools, hits, settings, filename)
 
+    # a copy that can be transformed and merged independently of this file, at a fraction of the cost of
+    # copy.deepcopy: the tools are deep copied, the hits and the other statements are shallow copies
+    # (their values are replaced, never modified in place)
+    def clone(self):
+        clone = shallow_copy(self)
+        memo = {}
+        clone.tools = copy.deepcopy(self.tools, memo)
+        clone.statements = [memo[id(statement)] if id(statement) in memo else shallow_copy(statement)
+                            for statement in self.statements]
+        clone.hits = []
+        for hit in self.hits:
+            hit_copy = shallow_copy(hit)
+            hit_copy.tool = copy.deepcopy(hit.tool, memo)
+            if isinstance(hit, DrillRout):
+                hit_copy.nodes = [shallow_copy(node) for node in hit.nodes]
+            clone.hits.append(hit_copy)
+        return clone
+
     def rotate(self, angle, center=(0,0)):
         if angle % 360 == 0:
             return
         for hit in self.hits:
             hit.rotate(angle, center)
+
+    # applies a 2D affine matrix (see hm_gerber_ex.utility) to the hits in a single pass, instead of
+    # a separate pass for every offset() and rotate() (like rotate(), the statements are left as parsed)
+    def transform(self, matrix):
+        for hit in self.hits:
+            hit.transform(matrix)
     
     def to_inch(self):
         if self.units == 'metric':
@@ -232,6 +257,9 @@ class DrillHitEx(DrillHit):
     def rotate(self, angle, center=(0, 0)):
         self.position = rotate(*self.position, angle, center)
 
+    def transform(self, matrix):
+        self.position = transform_point(matrix, *self.position)
+
     def to_excellon(self, settings):
         return CoordinateStmtEx(*self.position).to_excellon(settings)
 
@@ -249,6 +277,10 @@ class DrillSlotEx(DrillSlot):
         self.start = rotate(*self.start, angle, center)
         self.end = rotate(*self.end, angle, center)
 
+    def transform(self, matrix):
+        self.start = transform_point(matrix, *self.start)
+        self.end = transform_point(matrix, *self.end)
+
     def to_excellon(self, settings):
         return SlotStmt(*self.start, *self.end).to_excellon(settings)
 
@@ -309,6 +341,12 @@ class DrillRout(object):
             if node.center_offset is not None:
                 node.center_offset = rotate(*node.center_offset, angle, (0., 0.))
 
+    def transform(self, matrix):
+        for node in self.nodes:
+            node.position = transform_point(matrix, *node.position)
+            if node.center_offset is not None:
+                node.center_offset = transform_vector(matrix, *node.center_offset)
+
 
 class UnitStmtEx(UnitStmt):
     @classmethod
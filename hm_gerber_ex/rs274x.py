@@ -8,11 +8,13 @@ from hm_gerber_tool.cam import FileSettings
 import hm_gerber_tool.rs274x
 from hm_gerber_tool.gerber_statements import *
 from hm_gerber_ex.gerber_statements import AMParamStmt, AMParamStmtEx, ADParamStmtEx
-from hm_gerber_ex.utility import rotate
+from hm_gerber_ex.utility import rotate, is_translation_matrix, translation_matrix, rotation_matrix, shallow_copy
+from hm_gerber_ex.coordinates import CoordinateColumns
+import copy
 import re
 
 
-def loads(data, filename=None):
+def loads(data, filename=None, statements_only=False):
     cls = hm_gerber_tool.rs274x.GerberParser
     cls.SF = r"(?P<param>SF)(A(?P<a>{decimal}))?(B(?P<b>{decimal}))?".format(decimal=cls.DECIMAL)
     cls.PARAMS = (cls.FS, cls.MO, cls.LP, cls.AD_CIRCLE,
@@ -20,7 +22,8 @@ def loads(data, filename=None):
                   cls.AD_MACRO, cls.AM, cls.AS, cls.IF, cls.IN,
                   cls.IP, cls.IR, cls.MI, cls.OF, cls.SF, cls.LN)
     cls.PARAM_STMT = [re.compile(r"%?{0}\*%?".format(p)) for p in cls.PARAMS]
-    return cls().parse_raw(data, filename)
+    cls.PARAM_STMT_BY_NAME = hm_gerber_tool.rs274x._group_by_param_name(cls.PARAMS, cls.PARAM_STMT)
+    return cls(statements_only).parse_raw(data, filename)
 
 
 def write_gerber_header(file, settings):
@@ -37,7 +40,8 @@ class GerberFile(hm_gerber_tool.rs274x.GerberFile):
         if not isinstance(gerber_file, hm_gerber_tool.rs274x.GerberFile):
             raise Exception('only gerber.rs274x.GerberFile object is specified')
 
-        return cls(gerber_file.statements, gerber_file.settings, gerber_file.primitives,
+        # the primitives are passed as they are, so that the ones not parsed yet stay that way
+        return cls(gerber_file.statements, gerber_file.settings, gerber_file._primitives,
                    gerber_file.apertures, gerber_file.filename)
 
     def __init__(self, statements, settings, primitives, apertures, filename=None):
@@ -46,6 +50,7 @@ class GerberFile(hm_gerber_tool.rs274x.GerberFile):
         self.aperture_macros = {}
         self.aperture_defs = []
         self.main_statements = []
+        self.columns = None
         for stmt in self.statements:
             type, stmts = self.context.normalize_statement(stmt)
             if type == self.context.TYPE_AM:
@@ -68,24 +73,68 @@ class GerberFile(hm_gerber_tool.rs274x.GerberFile):
         self.context.format = self.format
         self.units = self.units
         filename = filename if filename is not None else self.filename
+        self.sync_columns()
         with open(filename, 'w') as f:
             write_gerber_header(f, self.context)
             for macro in self.aperture_macros:
                 f.write(self.aperture_macros[macro].to_gerber(self.context) + '\n')
             for aperture in self.aperture_defs:
                 f.write(aperture.to_gerber(self.context) + '\n')
-            for statement in self.main_statements:
-                f.write(statement.to_gerber(self.context) + '\n')
+            for line in statements_to_gerber(self.main_statements, self.context):
+                f.write(line + '\n')
             f.write('M02*\n')
 
+    # a copy that can be transformed and merged independently of this file, at a fraction of the cost of
+    # copy.deepcopy: the statements are shallow copies (their values are replaced, never modified in place),
+    # only the few aperture macros and definitions are deep copied, and the lazily parsed primitives are shared
+    def clone(self):
+        clone = shallow_copy(self)
+        clone.context = shallow_copy(self.context)
+        copies = {}
+        for statement in self.statements:
+            if isinstance(statement, (AMParamStmt, ADParamStmt)):
+                copies[id(statement)] = copy.deepcopy(statement)
+        clone.aperture_macros = {name: copy.deepcopy(macro) for name, macro in self.aperture_macros.items()}
+        clone.aperture_defs = [copy.deepcopy(aperture) for aperture in self.aperture_defs]
+        clone.main_statements = []
+        for statement in self.main_statements:
+            statement_copy = shallow_copy(statement)
+            copies[id(statement)] = statement_copy
+            clone.main_statements.append(statement_copy)
+        clone.statements = [copies[id(statement)] if id(statement) in copies else shallow_copy(statement)
+                            for statement in self.statements]
+        if self.columns is not None:
+            clone.columns = self.columns.copy([copies[id(statement)] for statement in self.columns.statements])
+        if self.has_primitives:
+            clone._primitives = copy.deepcopy(self._primitives)
+        clone._primitives_updates = list(self._primitives_updates)
+        return clone
+
+    # optional columnar storage of the coordinates (see hm_gerber_ex.coordinates), offset(), rotate(),
+    # transform() and the unit conversions then work on the columns, until sync_columns() is called
+    def use_columns(self):
+        if self.columns is None:
+            self.columns = CoordinateColumns(self.main_statements, self.units)
+        return self.columns
+
+    def sync_columns(self):
+        if self.columns is not None:
+            self.columns.sync()
+
     def to_inch(self):
         if self.units == 'metric':
             for macro in self.aperture_macros:
                 self.aperture_macros[macro].to_inch()
             for aperture in self.aperture_defs:
                 aperture.to_inch()
-            for statement in self.statements:
-                statement.to_inch()
+            if self.columns is not None:
+                self.columns.to_inch()
+                for statement in self.statements:
+                    if not CoordinateColumns.is_column_statement(statement):
+                        statement.to_inch()
+            else:
+                for statement in self.statements:
+                    statement.to_inch()
             self.units = 'inch'
             self.context.units = 'inch'
 
@@ -95,24 +144,68 @@ class GerberFile(hm_gerber_tool.rs274x.GerberFile):
                 self.aperture_macros[macro].to_metric()
             for aperture in self.aperture_defs:
                 aperture.to_metric()
-            for statement in self.statements:
-                statement.to_metric()
+            if self.columns is not None:
+                self.columns.to_metric()
+                for statement in self.statements:
+                    if not CoordinateColumns.is_column_statement(statement):
+                        statement.to_metric()
+            else:
+                for statement in self.statements:
+                    statement.to_metric()
             self.units = 'metric'
             self.context.units = 'metric'
 
     def offset(self, x_offset=0, y_offset=0):
+        if self.columns is not None:
+            self.transform(translation_matrix(x_offset, y_offset))
+            return
         for statement in self.main_statements:
             if isinstance(statement, CoordStmt):
                 if statement.x is not None:
                     statement.x += x_offset
                 if statement.y is not None:
                     statement.y += y_offset
-        for primitive in self.primitives:
-            primitive.offset(x_offset, y_offset)
+        self.update_primitives('offset', x_offset, y_offset)
+
+    # applies a 2D affine matrix (see hm_gerber_ex.utility) in a single pass, instead of a separate
+    # pass for every offset() and rotate(); the primitives can only be translated (like offset() does),
+    # and can be skipped when they are not needed (ex. when merging into a composition)
+    def transform(self, matrix, primitives=True):
+        a, b, c, d, e, f = matrix
+        translation = is_translation_matrix(matrix)
+        if not translation:
+            # see rotate()
+            for aperture in self.aperture_defs:
+                aperture.flip()
+
+        if self.columns is not None:
+            self.columns.transform(matrix)
+        else:
+            self._transform_statements(matrix)
+
+        if primitives and translation:
+            self.update_primitives('offset', c, f)
+
+    def _transform_statements(self, matrix):
+        a, b, c, d, e, f = matrix
+        for statement in self.main_statements:
+            if isinstance(statement, CoordStmt) and statement.x is not None and statement.y is not None:
+                x = statement.x
+                y = statement.y
+                statement.x = a * x + b * y + c
+                statement.y = d * x + e * y + f
+                if statement.i is not None and statement.j is not None:
+                    i = statement.i
+                    j = statement.j
+                    statement.i = a * i + b * j
+                    statement.j = d * i + e * j
 
     def rotate(self, angle, center=(0, 0)):
         if angle % 360 == 0:
             return
+        if self.columns is not None:
+            self.transform(rotation_matrix(angle, center))
+            return
         last_x = 0
         last_y = 0
         last_rx = 0
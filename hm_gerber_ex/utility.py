@@ -5,6 +5,9 @@
 # Copyright 2019 Hiroshi Murayama <opiopan@gmail.com>
 
 
+import os
+from contextlib import contextmanager
+from itertools import islice
 from math import cos, sin, pi, sqrt
 
 
@@ -16,6 +19,55 @@ def rotate(x, y, angle, center):
             sin(angle) * x0 + cos(angle) * y0 + center[1])
 
 
+# 2D affine matrices are (a, b, c, d, e, f) tuples, transforming (x, y) to:
+#   (a * x + b * y + c, d * x + e * y + f)
+IDENTITY_MATRIX = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+
+def translation_matrix(x_offset, y_offset):
+    return (1.0, 0.0, x_offset, 0.0, 1.0, y_offset)
+
+
+def rotation_matrix(angle, center=(0, 0)):
+    if angle % 360 == 0:
+        return IDENTITY_MATRIX
+    angle = angle * pi / 180.0
+    c = cos(angle)
+    s = sin(angle)
+    return (c, -s, center[0] - c * center[0] + s * center[1],
+            s, c, center[1] - s * center[0] - c * center[1])
+
+
+# the matrix applying m2 first, and then m1
+def multiply_matrix(m1, m2):
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (a1 * a2 + b1 * d2, a1 * b2 + b1 * e2, a1 * c2 + b1 * f2 + c1,
+            d1 * a2 + e1 * d2, d1 * b2 + e1 * e2, d1 * c2 + e1 * f2 + f1)
+
+
+def is_translation_matrix(matrix):
+    return matrix[0] == 1.0 and matrix[1] == 0.0 and matrix[3] == 0.0 and matrix[4] == 1.0
+
+
+def transform_point(matrix, x, y):
+    return (matrix[0] * x + matrix[1] * y + matrix[2],
+            matrix[3] * x + matrix[4] * y + matrix[5])
+
+
+# transforms a relative vector (ex. arc center offsets), so without the translation
+def transform_vector(matrix, x, y):
+    return (matrix[0] * x + matrix[1] * y,
+            matrix[3] * x + matrix[4] * y)
+
+
+# a new instance of the same class sharing the attribute values (like copy.copy, without its overhead)
+def shallow_copy(obj):
+    clone = obj.__class__.__new__(obj.__class__)
+    clone.__dict__.update(obj.__dict__)
+    return clone
+
+
 def is_equal_value(a, b, error_range=0):
     return (a - b) * (a - b) <= error_range * error_range
 
@@ -31,4 +83,51 @@ def normalize_vec2d(vec):
 
 
 def dot_vec2d(vec1, vec2):
-    return vec1[0] * vec2[0] + vec1[1] * vec2[1]
\ No newline at end of file
+    return vec1[0] * vec2[0] + vec1[1] * vec2[1]
+
+
+# collects the written text and passes it on to a binary file in large encoded chunks,
+# instead of one small write per statement
+class ChunkedWriter(object):
+    CHUNK_SIZE = 4096
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE, encoding='utf-8'):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self._chunk = []
+
+    def write(self, text):
+        self._chunk.append(text)
+        if len(self._chunk) >= self.chunk_size:
+            self.flush()
+
+    # lines is an iterable (ex. a generator) of lines without their line endings
+    def write_lines(self, lines):
+        self.flush()
+        lines = iter(lines)
+        while True:
+            chunk = list(islice(lines, self.chunk_size))
+            if len(chunk) == 0:
+                break
+            chunk.append('')
+            self.file.write('\n'.join(chunk).encode(self.encoding))
+
+    def flush(self):
+        if len(self._chunk) > 0:
+            self.file.write(''.join(self._chunk).encode(self.encoding))
+            self._chunk.clear()
+
+
+# path_or_file is either a path, or any binary file-like object (which is left open)
+@contextmanager
+def chunked_writer(path_or_file, buffer_size=1024*1024):
+    if isinstance(path_or_file, (str, bytes, os.PathLike)):
+        with open(path_or_file, 'wb', buffering=buffer_size) as f:
+            writer = ChunkedWriter(f)
+            yield writer
+            writer.flush()
+    else:
+        writer = ChunkedWriter(path_or_file)
+        yield writer
+        writer.flush()
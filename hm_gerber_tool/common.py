@@ -44,7 +44,7 @@ def read(filename):
             return None
 
 
-def loads(data, filename=None):
+def loads(data, filename=None, file_format=None):
     """ Read gerber or excellon file contents from a string and return a
     representative object.
 
@@ -56,6 +56,10 @@ def loads(data, filename=None):
     filename : string, optional
         String containing the filename of the data source.
 
+    file_format : string, optional
+        Format of the data, as returned by detect_file_format. Detected if
+        not given.
+
     Returns
     -------
     file : CncFile subclass
@@ -63,7 +67,7 @@ def loads(data, filename=None):
         or IPCNetlist. Returns None if data is not of the proper type.
     """
 
-    fmt = detect_file_format(data)
+    fmt = file_format if file_format is not None else detect_file_format(data)
     if fmt == 'rs274x':
         return rs274x.loads(data, filename=filename)
     elif fmt == 'excellon':
@@ -26,12 +26,13 @@ This module provides Excellon file classes and parsing utilities
 
 import math
 import operator
+import re
 
 from .cam import CamFile, FileSettings
 from .excellon_statements import *
 from .excellon_tool import ExcellonToolDefinitionParser
 from .primitives import Drill, Slot
-from .utils import inch, metric
+from .utils import inch, metric, parse_gerber_value
 
 try:
     from cStringIO import StringIO
@@ -382,9 +383,25 @@ class ExcellonParser(object):
     ----------
     settings : FileSettings or dict-like
         Excellon file settings to use when interpreting the excellon file.
+
+    keep_tokens : bool, optional
+        Also keep the raw (not yet interpreted) numbers of the hits, in
+        `tokens`, so that they can be interpreted again with other settings,
+        see `detect_excellon_format`.
     """
 
-    def __init__(self, settings=None, ext_tools=None):
+    # the tokens operations, see _add_hit_tokens() and _interpret_tokens()
+    MOVE_TOKEN = 0
+    REPEAT_TOKEN = 1
+    HIT_TOKEN = 2
+    ROUT_TOKEN = 3
+    SLOT_TOKEN = 4
+    UNKNOWN_TOKEN = 'unknown'
+
+    REPEAT_HOLE = re.compile(r'R(?P<rcount>[0-9]*)X?(?P<xdelta>[+\-]?\d*\.?\d*)?Y?'
+                             r'(?P<ydelta>[+\-]?\d*\.?\d*)?')
+
+    def __init__(self, settings=None, ext_tools=None, keep_tokens=False):
         self.notation = 'absolute'
         self.units = 'inch'
         self.zeros = 'leading'
@@ -401,6 +418,11 @@ class ExcellonParser(object):
         self._previous_line = ''
         # Default for plated is None, which means we don't know
         self.plated = ExcellonTool.PLATED_UNKNOWN
+        # the format and zeros set by the file itself (and not by the settings)
+        self.file_format = False
+        self.file_zeros = False
+        self.tokens = [] if keep_tokens else None
+        self.diameter_tokens = {}
         if settings is not None:
             self.units = settings.units
             self.zeros = settings.zeros
@@ -464,6 +486,7 @@ class ExcellonParser(object):
                     [int(x) for x in comment_stmt.comment.split('=')[1].split(":")])
                 if detected_format:
                     self.format = detected_format
+                    self.file_format = True
 
             if "TYPE=PLATED" in comment_stmt.comment:
                 self.plated = ExcellonTool.PLATED_YES
@@ -537,19 +560,8 @@ class ExcellonParser(object):
             stmt = CoordinateStmt.from_excellon(line[3:], self._settings())
             stmt.mode = self.state
 
-            x = stmt.x
-            y = stmt.y
             self.statements.append(stmt)
-            if self.notation == 'absolute':
-                if x is not None:
-                    self.pos[0] = x
-                if y is not None:
-                    self.pos[1] = y
-            else:
-                if x is not None:
-                    self.pos[0] += x
-                if y is not None:
-                    self.pos[1] += y
+            self._move(stmt.x, stmt.y, self._coordinate_tokens(line[3:]))
 
         elif line[:3] == 'G01':
 
@@ -567,19 +579,8 @@ class ExcellonParser(object):
             # The start position is where we were before the rout command
             start = (self.pos[0], self.pos[1])
 
-            x = stmt.x
-            y = stmt.y
             self.statements.append(stmt)
-            if self.notation == 'absolute':
-                if x is not None:
-                    self.pos[0] = x
-                if y is not None:
-                    self.pos[1] = y
-            else:
-                if x is not None:
-                    self.pos[0] += x
-                if y is not None:
-                    self.pos[1] += y
+            self._move(stmt.x, stmt.y, self._coordinate_tokens(line[3:]))
 
             # Our ending position
             end = (self.pos[0], self.pos[1])
@@ -589,6 +590,7 @@ class ExcellonParser(object):
                     self.active_tool = self._get_tool(1)
 
                 self.hits.append(DrillSlot(self.active_tool, start, end, DrillSlot.TYPE_ROUT))
+                self._add_hit_tokens(self.ROUT_TOKEN)
                 self.active_tool._hit()
 
         elif line[:3] == 'G05':
@@ -600,8 +602,10 @@ class ExcellonParser(object):
             stmt = UnitStmt.from_excellon(line)
             self.units = stmt.units
             self.zeros = stmt.zeros
+            self.file_zeros = True
             if stmt.format:
                 self.format = stmt.format
+                self.file_format = True
             self.statements.append(stmt)
 
         elif line[:3] == 'M71' or line[:3] == 'M72':
@@ -622,6 +626,7 @@ class ExcellonParser(object):
             stmt = FormatStmt.from_excellon(line)
             self.statements.append(stmt)
             self.format = stmt.format_tuple
+            self.file_format = True
 
         elif line[:3] == 'G40':
             self.statements.append(CutterCompensationOffStmt())
@@ -646,6 +651,8 @@ class ExcellonParser(object):
                 self._merge_properties(tool)
                 self.tools[tool.number] = tool
                 self.statements.append(tool)
+                if self.tokens is not None:
+                    self.diameter_tokens[id(tool)] = self._diameter_token(line, tool)
             else:
                 self.statements.append(UnknownStmt.from_excellon(line))
 
@@ -667,6 +674,8 @@ class ExcellonParser(object):
                     tool = ExcellonTool(
                         self._settings(), number=stmt.tool, diameter=diameter)
                     self.tools[tool.number] = tool
+                    if self.tokens is not None:
+                        self.diameter_tokens[id(tool)] = diameter
 
                     # FIXME: need to add this tool definition inside header to
                     # make sure it is properly written
@@ -680,33 +689,26 @@ class ExcellonParser(object):
         elif line[0] == 'R' and self.state != 'HEADER':
             stmt = RepeatHoleStmt.from_excellon(line, self._settings())
             self.statements.append(stmt)
+            deltas = self._repeat_tokens(line)
             for i in range(stmt.count):
                 self.pos[0] += stmt.xdelta if stmt.xdelta is not None else 0
                 self.pos[1] += stmt.ydelta if stmt.ydelta is not None else 0
                 self.hits.append(DrillHit(self.active_tool, tuple(self.pos)))
+                if deltas is not None:
+                    self.tokens.append((self.REPEAT_TOKEN,) + deltas)
+                    self._add_hit_tokens(self.HIT_TOKEN)
                 self.active_tool._hit()
 
         elif line[0] in ['X', 'Y']:
             if 'G85' in line:
                 stmt = SlotStmt.from_excellon(line, self._settings())
 
-                # I don't know if this is actually correct, but it makes sense
-                # that this is where the tool would end
-                x = stmt.x_end
-                y = stmt.y_end
-
                 self.statements.append(stmt)
 
-                if self.notation == 'absolute':
-                    if x is not None:
-                        self.pos[0] = x
-                    if y is not None:
-                        self.pos[1] = y
-                else:
-                    if x is not None:
-                        self.pos[0] += x
-                    if y is not None:
-                        self.pos[1] += y
+                # I don't know if this is actually correct, but it makes sense
+                # that this is where the tool would end
+                start, end = self._slot_tokens(line)
+                self._move(stmt.x_end, stmt.y_end, end)
 
                 if self.state == 'DRILL' or self.state == 'HEADER':
                     if not self.active_tool:
@@ -714,6 +716,7 @@ class ExcellonParser(object):
 
                     self.hits.append(DrillSlot(self.active_tool, (stmt.x_start, stmt.y_start), (stmt.x_end, stmt.y_end),
                                                DrillSlot.TYPE_G85))
+                    self._add_hit_tokens(self.SLOT_TOKEN, start, end)
                     self.active_tool._hit()
             else:
                 stmt = CoordinateStmt.from_excellon(line, self._settings())
@@ -721,25 +724,15 @@ class ExcellonParser(object):
                 # We need this in case we are in rout mode
                 start = (self.pos[0], self.pos[1])
 
-                x = stmt.x
-                y = stmt.y
                 self.statements.append(stmt)
-                if self.notation == 'absolute':
-                    if x is not None:
-                        self.pos[0] = x
-                    if y is not None:
-                        self.pos[1] = y
-                else:
-                    if x is not None:
-                        self.pos[0] += x
-                    if y is not None:
-                        self.pos[1] += y
+                self._move(stmt.x, stmt.y, self._coordinate_tokens(line))
 
                 if self.state == 'LINEAR' and self.drill_down:
                     if not self.active_tool:
                         self.active_tool = self._get_tool(1)
 
                     self.hits.append(DrillSlot(self.active_tool, start, tuple(self.pos), DrillSlot.TYPE_ROUT))
+                    self._add_hit_tokens(self.ROUT_TOKEN)
 
                 elif self.state == 'DRILL' or self.state == 'HEADER':
                     # Yes, drills in the header doesn't follow the specification, but it there are many
@@ -748,6 +741,7 @@ class ExcellonParser(object):
                         self.active_tool = self._get_tool(1)
 
                     self.hits.append(DrillHit(self.active_tool, tuple(self.pos)))
+                    self._add_hit_tokens(self.HIT_TOKEN)
                     self.active_tool._hit()
 
         else:
@@ -757,6 +751,76 @@ class ExcellonParser(object):
         return FileSettings(units=self.units, format=self.format,
                             zeros=self.zeros, notation=self.notation)
 
+    def _move(self, x, y, tokens=None):
+        absolute = self.notation == 'absolute'
+        if absolute:
+            if x is not None:
+                self.pos[0] = x
+            if y is not None:
+                self.pos[1] = y
+        else:
+            if x is not None:
+                self.pos[0] += x
+            if y is not None:
+                self.pos[1] += y
+        if tokens is not None:
+            self.tokens.append((self.MOVE_TOKEN, tokens[0], tokens[1], absolute))
+
+    def _token(self, value):
+        # a raw number, with the format and zeros that the file set for it (None for the ones of the settings)
+        return (value,
+                self.format if self.file_format else None,
+                self.zeros if self.file_zeros else None)
+
+    def _coordinate_tokens(self, line):
+        # the same split as CoordinateStmt.from_excellon()
+        if self.tokens is None:
+            return None
+        x_token = None
+        y_token = None
+        if line[0] == 'X':
+            splitline = line.strip('X').split('Y')
+            x_token = self._token(splitline[0])
+            if len(splitline) == 2:
+                y_token = self._token(splitline[1])
+        else:
+            y_token = self._token(line.strip(' Y'))
+        return (x_token, y_token)
+
+    def _slot_tokens(self, line):
+        # the same split as SlotStmt.from_excellon()
+        if self.tokens is None:
+            return (None, None)
+        sub_coords = line.split('G85')
+        start = self._coordinate_tokens(sub_coords[0])
+        x_end, y_end = self._coordinate_tokens(sub_coords[1])
+        end = (x_end if x_end is not None else start[0],
+               y_end if y_end is not None else start[1])
+        return (start, end)
+
+    def _repeat_tokens(self, line):
+        # the same match as RepeatHoleStmt.from_excellon(), a missing delta adds 0
+        if self.tokens is None:
+            return None
+        stmt = self.REPEAT_HOLE.match(line).groupdict()
+        return (self._token(stmt['xdelta']) if stmt['xdelta'] != '' else 0,
+                self._token(stmt['ydelta']) if stmt['ydelta'] != '' else 0)
+
+    def _diameter_token(self, line, tool):
+        # the same split as ExcellonTool.from_excellon(), the last diameter wins
+        token = tool.diameter
+        commands = re.split('([BCFHSTZ])', line)[1:]
+        for cmd, val in zip(commands[0::2], commands[1::2]):
+            if cmd == 'C':
+                token = self._token(val)
+        return token
+
+    def _add_hit_tokens(self, kind, *tokens):
+        if self.tokens is not None:
+            # tools that are not defined in the header (ex. only in comments) can not be interpreted again
+            diameter = self.diameter_tokens.get(id(self.active_tool), self.UNKNOWN_TOKEN)
+            self.tokens.append((kind, diameter) + tokens)
+
     def _add_comment_tool(self, tool):
         """
         Add a tool that was defined in the comments to this file.
@@ -835,8 +899,9 @@ def detect_excellon_format(data=None, filename=None):
         with open(filename, 'rU') as f:
             data = f.read()
 
-    # Check for obvious clues:
-    p = ExcellonParser()
+    # Check for obvious clues, and keep the raw numbers of the hits, to interpret them with every option below
+    # (with the FileSettings defaults, like the options, but the ExcellonParser defaults for the numbers)
+    p = ExcellonParser(FileSettings(zeros='leading', format=(2, 4)), keep_tokens=True)
     p.parse_raw(data)
 
     # Get zero_suppression from a unit statement
@@ -864,19 +929,27 @@ def detect_excellon_format(data=None, filename=None):
         zeros_options = (detected_zeros,)
 
     # Brute force all remaining options, and pick the best looking one...
+    tokens = p.tokens
+    if any(token[0] != ExcellonParser.MOVE_TOKEN and token[1] == ExcellonParser.UNKNOWN_TOKEN
+           for token in tokens):
+        tokens = None
     for zeros in zeros_options:
         for fmt in format_options:
             key = (fmt, zeros)
-            settings = FileSettings(zeros=zeros, format=fmt)
             try:
-                p = ExcellonParser(settings)
-                ef = p.parse_raw(data)
-                size = tuple([t[0] - t[1] for t in ef.bounding_box])
-                hole_area = 0.0
-                for hit in p.hits:
-                    tool = hit.tool
-                    hole_area += math.pow(math.pi * tool.diameter / 2., 2)
-                results[key] = (size, p.hole_count, hole_area)
+                if tokens is not None:
+                    # the hits do not depend on the format, only their numbers do
+                    results[key] = _interpret_tokens(tokens, fmt, zeros)
+                else:
+                    settings = FileSettings(zeros=zeros, format=fmt)
+                    p = ExcellonParser(settings)
+                    ef = p.parse_raw(data)
+                    size = tuple([t[0] - t[1] for t in ef.bounding_box])
+                    hole_area = 0.0
+                    for hit in p.hits:
+                        tool = hit.tool
+                        hole_area += math.pow(math.pi * tool.diameter / 2., 2)
+                    results[key] = (size, p.hole_count, hole_area)
             except:
                 pass
 
@@ -904,6 +977,77 @@ def detect_excellon_format(data=None, filename=None):
                 return {'format': key[0], 'zeros': key[1]}
 
 
+def _interpret_tokens(tokens, format, zeros):
+    """ The (size, hole count, hole area) of the hits in the tokens of an
+    ExcellonParser, as if it parsed the file with the format and zeros,
+    same as ExcellonFile.bounding_box, and with the same arithmetic.
+    """
+    values = {}
+
+    def value(token):
+        if not isinstance(token, tuple):
+            return token
+        result = values.get(token)
+        if result is None:
+            string, token_format, token_zeros = token
+            token_zeros = token_zeros if token_zeros is not None else zeros
+            result = parse_gerber_value(string,
+                                        token_format if token_format is not None else format,
+                                        'leading' if token_zeros == 'trailing' else 'trailing')
+            values[token] = result
+        return result
+
+    xmin = ymin = 100000000000
+    xmax = ymax = -100000000000
+    hole_count = 0
+    hole_area = 0.0
+    x = y = 0.
+    previous = (0., 0.)
+    for token in tokens:
+        kind = token[0]
+        if kind == ExcellonParser.MOVE_TOKEN:
+            previous = (x, y)
+            x_token = token[1]
+            y_token = token[2]
+            if token[3]:
+                if x_token is not None:
+                    x = value(x_token)
+                if y_token is not None:
+                    y = value(y_token)
+            else:
+                if x_token is not None:
+                    x += value(x_token)
+                if y_token is not None:
+                    y += value(y_token)
+            continue
+        if kind == ExcellonParser.REPEAT_TOKEN:
+            x += value(token[1])
+            y += value(token[2])
+            continue
+
+        diameter = value(token[1])
+        radius = diameter / 2.
+        if kind == ExcellonParser.HIT_TOKEN:
+            xmin = min(x - radius, xmin)
+            xmax = max(x + radius, xmax)
+            ymin = min(y - radius, ymin)
+            ymax = max(y + radius, ymax)
+        else:
+            if kind == ExcellonParser.ROUT_TOKEN:
+                start = previous
+                end = (x, y)
+            else:
+                start = (value(token[2][0]), value(token[2][1]))
+                end = (value(token[3][0]), value(token[3][1]))
+            xmin = min(min(start[0], end[0]) - radius, xmin)
+            xmax = max(max(start[0], end[0]) + radius, xmax)
+            ymin = min(min(start[1], end[1]) - radius, ymin)
+            ymax = max(max(start[1], end[1]) + radius, ymax)
+        hole_count += 1
+        hole_area += math.pow(math.pi * diameter / 2., 2)
+    return ((xmin - xmax, ymin - ymax), hole_count, hole_area)
+
+
 def _layer_size_score(size, hole_count, hole_area):
     """ Heuristic used for determining the correct file number interpretation.
     Lower is better.
@@ -20,8 +20,8 @@ Gerber (RS-274X) Statements
 **Gerber RS-274X file statement classes**
 
 """
-from .utils import (parse_gerber_value, write_gerber_value, decimal_string,
-                    inch, metric)
+from .utils import (parse_gerber_value, write_gerber_value, write_gerber_values,
+                    decimal_string, inch, metric)
 
 from .am_statements import *
 from .am_read import read_macro
@@ -871,6 +871,79 @@ class LNParamStmt(ParamStmt):
         return '<Level Name: %s>' % self.name
 
 
+class SRParamStmt(ParamStmt):
+    """ SR - Gerber Step and Repeat statement
+
+    An SR statement with x and y opens a step and repeat block, an SR
+    statement without them closes the current block.
+    """
+
+    @classmethod
+    def from_dict(cls, stmt_dict):
+        param = stmt_dict.get('param')
+        x = int(stmt_dict['x']) if stmt_dict.get('x') is not None else None
+        y = int(stmt_dict['y']) if stmt_dict.get('y') is not None else None
+        i = float(stmt_dict.get('i', 0))
+        j = float(stmt_dict.get('j', 0))
+        return cls(param, x, y, i, j)
+
+    def __init__(self, param, x=None, y=None, i=0.0, j=0.0):
+        """ Initialize SRParamStmt class
+
+        Parameters
+        ----------
+        param : string
+            Parameter code
+
+        x : int
+            Number of repeats along the X axis (None closes the block)
+
+        y : int
+            Number of repeats along the Y axis (None closes the block)
+
+        i : float
+            Step distance along the X axis
+
+        j : float
+            Step distance along the Y axis
+
+        Returns
+        -------
+        ParamStmt : SRParamStmt
+            Initialized SRParamStmt class.
+
+        """
+        ParamStmt.__init__(self, param)
+        self.x = x
+        self.y = y
+        self.i = i
+        self.j = j
+
+    def to_gerber(self, settings=None):
+        if self.x is None or self.y is None:
+            return '%SR*%'
+        return '%SRX{0}Y{1}I{2}J{3}*%'.format(self.x, self.y,
+                                             decimal_string(self.i, precision=6),
+                                             decimal_string(self.j, precision=6))
+
+    def to_inch(self):
+        if self.units == 'metric':
+            self.units = 'inch'
+            self.i = inch(self.i)
+            self.j = inch(self.j)
+
+    def to_metric(self):
+        if self.units == 'inch':
+            self.units = 'metric'
+            self.i = metric(self.i)
+            self.j = metric(self.j)
+
+    def __str__(self):
+        if self.x is None or self.y is None:
+            return '<Step and Repeat: end>'
+        return ('<Step and Repeat: X: %d Y: %d I: %g J: %g>' % (self.x, self.y, self.i, self.j))
+
+
 class DeprecatedStmt(Statement):
     """ Unimportant deprecated statement, will be parsed but not emitted.
     """
@@ -1004,17 +1077,23 @@ class CoordStmt(Statement):
         self.op = op
 
     def to_gerber(self, settings=None):
+        def value(v):
+            return None if v is None else write_gerber_value(v, settings.format, settings.zero_suppression)
+        return self._to_gerber(value(self.x), value(self.y), value(self.i), value(self.j))
+
+    def _to_gerber(self, x, y, i, j):
+        # x, y, i and j are the already formatted values, or None
         ret = ''
         if self.function:
             ret += self.function
-        if self.x is not None:
-            ret += 'X{0}'.format(write_gerber_value(self.x, settings.format, settings.zero_suppression))
-        if self.y is not None:
-            ret += 'Y{0}'.format(write_gerber_value(self.y, settings.format, settings.zero_suppression))
-        if self.i is not None:
-            ret += 'I{0}'.format(write_gerber_value(self.i, settings.format, settings.zero_suppression))
-        if self.j is not None:
-            ret += 'J{0}'.format(write_gerber_value(self.j, settings.format, settings.zero_suppression))
+        if x is not None:
+            ret += 'X{0}'.format(x)
+        if y is not None:
+            ret += 'Y{0}'.format(y)
+        if i is not None:
+            ret += 'I{0}'.format(i)
+        if j is not None:
+            ret += 'J{0}'.format(j)
         if self.op:
             ret += self.op
         return ret + '*'
@@ -1211,3 +1290,49 @@ class UnknownStmt(Statement):
 
     def __str__(self):
         return '<Unknown Statement: \'%s\'>' % self.line
+
+
+def statements_to_gerber(statements, settings, batch_size=65536):
+    """ Serialize statements, a batch at a time
+
+    Yields statement.to_gerber(settings) for every statement, but the x, y,
+    i and j columns of the CoordStmts of each batch are formatted with one
+    write_gerber_values call each, instead of one value at a time.
+
+    Parameters
+    ----------
+    statements : iterable of Statement
+        The statements to serialize
+
+    settings : FileSettings
+        Gerber file coordinate format
+
+    batch_size : int
+        Number of statements serialized at once
+
+    Returns
+    -------
+    lines : iterator of string
+        The serialized statements
+    """
+    batch = []
+    for statement in statements:
+        batch.append(statement)
+        if len(batch) == batch_size:
+            yield from _batch_to_gerber(batch, settings)
+            batch = []
+    if batch:
+        yield from _batch_to_gerber(batch, settings)
+
+
+def _batch_to_gerber(statements, settings):
+    coords = [statement for statement in statements if isinstance(statement, CoordStmt)]
+    columns = [iter(write_gerber_values([getattr(statement, name) for statement in coords],
+                                        settings.format, settings.zero_suppression))
+               for name in ('x', 'y', 'i', 'j')]
+    x, y, i, j = columns
+    for statement in statements:
+        if isinstance(statement, CoordStmt):
+            yield statement._to_gerber(next(x), next(y), next(i), next(j))
+        else:
+            yield statement.to_gerber(settings)
@@ -0,0 +1,193 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2022 HalfMarble LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Persistent cache of parsed layers
+=====================================
+**On-disk cache of the PCBLayer objects built by PCB.from_directory**
+
+The layers are pickled into a per-user cache directory, keyed by a hash of the
+file name, the file content, the layer hints and the parser version, so any
+change of those is a cache miss. The directory is not part of the key, so a
+board that was copied or extracted into a temporary directory still hits, and
+the loaded layers are moved to the path they were requested for. The least
+recently used entries are evicted once the cache grows over its size limit.
+
+Entries are written to a temporary file and atomically renamed, so concurrent
+processes never see partial entries. Any cache error is treated as a miss.
+"""
+
+import gc
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+from .layers import _hints_key
+
+# bump this when the pickled layers change in a way the parser sources do not show
+LAYER_CACHE_VERSION = 1
+
+LAYER_CACHE_MAX_SIZE = 256 * 1024 * 1024
+LAYER_CACHE_EXTENSION = '.layer'
+
+_parser_version = None
+
+
+def default_cache_directory():
+    """ Per-user cache directory, HM_PANELIZER_CACHE overrides it
+    """
+    directory = os.environ.get('HM_PANELIZER_CACHE')
+    if directory:
+        return directory
+    if sys.platform == 'darwin':
+        root = os.path.join(os.path.expanduser('~'), 'Library', 'Caches')
+    elif sys.platform == 'win32':
+        root = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        root = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(root, 'hm-panelizer', 'layers')
+
+
+def parser_version():
+    """ Hash of the cache version, the python version and the sources of this package,
+    so that any change of the parsers invalidates the cached layers
+    """
+    global _parser_version
+    if _parser_version is None:
+        digest = hashlib.sha256()
+        digest.update('{}:{}'.format(LAYER_CACHE_VERSION, sys.version).encode('utf-8'))
+        package = os.path.dirname(os.path.abspath(__file__))
+        for filename in sorted(os.listdir(package)):
+            if filename.endswith('.py'):
+                with open(os.path.join(package, filename), 'rb') as f:
+                    digest.update(filename.encode('utf-8'))
+                    digest.update(f.read())
+        _parser_version = digest.hexdigest()
+    return _parser_version
+
+
+def _load_paused_gc(f):
+    # a layer unpickles into hundreds of thousands of small objects, and every collection the allocations
+    # trigger walks all of them, the collector is paused while loading (about 2.5x faster), none of them is garbage
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.load(f)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class LayerCache(object):
+    """ On-disk LRU cache of parsed layers
+
+    Parameters
+    ----------
+    directory : string
+        Cache directory, created on the first store. Defaults to default_cache_directory()
+
+    max_size : int
+        Size limit of the cache, in bytes
+    """
+
+    def __init__(self, directory=None, max_size=LAYER_CACHE_MAX_SIZE):
+        self.directory = directory if directory is not None else default_cache_directory()
+        self.max_size = max_size
+
+    def key(self, path, data):
+        digest = hashlib.sha256()
+        digest.update(parser_version().encode('utf-8'))
+        digest.update(repr(_hints_key()).encode('utf-8'))
+        digest.update(os.path.basename(path).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(data.encode('utf-8', 'surrogateescape'))
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + LAYER_CACHE_EXTENSION)
+
+    def load(self, key, path):
+        """ Returns the cached layer for the file at path, or None on a miss or any cache error
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                layer = _load_paused_gc(f)
+            layer.filename = path
+            if layer.cam_source is not None:
+                layer.cam_source.filename = path
+        except Exception:
+            return None
+        try:
+            # touch the entry, the eviction goes by the modification time
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        return layer
+
+    def store(self, key, layer):
+        """ Stores the layer, returns False if it could not be stored
+        """
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(layer, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._entry_path(key))
+            temp_path = None
+        except Exception:
+            return False
+        finally:
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+        return True
+
+    def evict(self):
+        """ Removes the least recently used entries, until the cache fits into max_size
+        """
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(LAYER_CACHE_EXTENSION):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        except OSError:
+            return
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for mtime, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                # another process got there first
+                pass
+            total -= size
+            if total <= self.max_size:
+                break
@@ -46,14 +46,19 @@
 import os
 import re
 from collections import namedtuple
+from functools import lru_cache
 
 from . import common
 from .excellon import ExcellonFile
 from .ipc356 import IPCNetlist
+from .utils import read_file_format
 
 
 Hint = namedtuple('Hint', 'layer ext name regex content')
 
+# number of characters, from the start of the file, that are searched for the content hints
+CONTENT_HEADER_SIZE = 64 * 1024
+
 hints = [
     Hint(layer='top_copper',
          ext=['gtl', 'cmp', 'top', ],
@@ -157,46 +162,97 @@ def layer_signatures(layer_class):
 
 
 def load_layer(filename):
-    return PCBLayer.from_cam(common.read(filename))
+    file_format, data = read_file_format(filename)
+    try:
+        camfile = common.loads(data, filename, file_format)
+    except:
+        camfile = None
+    return PCBLayer.from_cam(camfile, data)
 
 
 def load_layer_data(data, filename=None):
-    return PCBLayer.from_cam(common.loads(data, filename))
+    return PCBLayer.from_cam(common.loads(data, filename), data)
+
+
+def _hints_key():
+    # hints can be changed at runtime, so the compiled patterns are cached by their content
+    return tuple((hint.layer, hint.regex, tuple(hint.name), tuple(hint.content)) for hint in hints)
+
 
+@lru_cache(maxsize=8)
+def _compile_hints(key):
+    """ Compile the hints into a (layer, regex, name, content) tuple per hint, and
+    a regex that matches any of the contents.
 
-def guess_layer_class(filename):
+    The name patterns of a hint are combined into one alternation, which matches if
+    any of them does, and so are its contents.
+    """
+    compiled = []
+    for layer, regex, names, contents in key:
+        name = None
+        if names:
+            name = re.compile(r'^(\w*[.-])*(?:{})([.-]\w*)?$'.format('|'.join('(?:{})'.format(x) for x in names)),
+                              re.IGNORECASE)
+        content = None
+        if contents:
+            content = re.compile('|'.join('(?:{})'.format(x) for x in contents), re.IGNORECASE)
+        compiled.append((layer, re.compile(regex, re.IGNORECASE) if regex else None, name, content))
+    contents = [x for _, _, _, hint_contents in key for x in hint_contents]
+    any_content = re.compile('|'.join('(?:{})'.format(x) for x in contents), re.IGNORECASE) if contents else None
+    return compiled, any_content
+
+
+def guess_layer_class(filename, data=None):
     try:
-        layer = guess_layer_class_by_content(filename)
+        layer = guess_layer_class_by_content(filename, data)
         if layer:
             return layer
     except:
         pass
 
     try:
+        compiled, _ = _compile_hints(_hints_key())
         directory, filename = os.path.split(filename)
         name, ext = os.path.splitext(filename.lower())
-        for hint in hints:
-            if hint.regex:
-                if re.findall(hint.regex, filename, re.IGNORECASE):
-                    return hint.layer
-
-            patterns = [r'^(\w*[.-])*{}([.-]\w*)?$'.format(x) for x in hint.name]
-            if ext[1:] in hint.ext or any(re.findall(p, name, re.IGNORECASE) for p in patterns):
-                return hint.layer
+        for hint, (layer, regex, name_pattern, _) in zip(hints, compiled):
+            if regex is not None:
+                if regex.search(filename):
+                    return layer
+
+            if ext[1:] in hint.ext or (name_pattern is not None and name_pattern.search(name)):
+                return layer
     except:
         pass
     return 'unknown'
 
 
-def guess_layer_class_by_content(filename):
+def guess_layer_class_by_content(filename, data=None, header_size=CONTENT_HEADER_SIZE):
+    """ The layer class of the first line (in the first header_size characters, or in all
+    of them if None) that matches the content of a hint, or False.
+
+    The data is read from the file, unless it is given.
+    """
     try:
-        file = open(filename, 'r')
-        for line in file:
-            for hint in hints:
-                if len(hint.content) > 0:
-                    patterns = [r'^(.*){}(.*)$'.format(x) for x in hint.content]
-                    if any(re.findall(p, line, re.IGNORECASE) for p in patterns):
-                        return hint.layer
+        compiled, any_content = _compile_hints(_hints_key())
+        if any_content is None:
+            return False
+        if data is None:
+            with open(filename, 'r') as file:
+                data = file.read(header_size) if header_size is not None else file.read()
+        elif header_size is not None:
+            data = data[:header_size]
+
+        # only the lines with a match are checked hint by hint, in order
+        match = any_content.search(data)
+        while match is not None:
+            start = data.rfind('\n', 0, match.start()) + 1
+            end = data.find('\n', match.start())
+            end = len(data) if end < 0 else end
+            line = data[start:end]
+            for layer, _, _, content in compiled:
+                if content is not None and content.search(line):
+                    return layer
+            match = any_content.search(data, end + 1)
     except:
         pass
 
@@ -252,10 +308,10 @@ class PCBLayer(object):
 
     """
     @classmethod
-    def from_cam(cls, camfile):
+    def from_cam(cls, camfile, data=None):
         filename = camfile.filename
         metric = camfile.is_metric
-        layer_class = guess_layer_class(filename)
+        layer_class = guess_layer_class(filename, data)
         if isinstance(camfile, ExcellonFile) or (layer_class == 'drill'):
             return DrillLayer.from_cam(camfile)
         elif layer_class == 'internal':
@@ -18,30 +18,90 @@
 
 
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 from hm_gerber_tool.cam import CamFile
 from .exceptions import ParseError
+from . import layers as layers_module
 from .layers import PCBLayer, sort_layers, layer_signatures
-from .common import read as gerber_read
+from .common import loads as gerber_loads
+from .layer_cache import LayerCache
 from .utils import listdir
 
 
 skip_extensions = ['.kicad_sch', '.kicad_prl', '.gbrjob', '.zip', '.png', '.jpg']
 
 
+def _parse_layer(path, data):
+    try:
+        camfile = gerber_loads(data, path)
+    except:
+        camfile = None
+    if camfile is not None:
+        return PCBLayer.from_cam(camfile, data)
+    return None
+
+
+# files are [filename, path, data, key, layer] lists, the parsed layers are set in place
+def _parse_layers(files, verbose):
+    for file in files:
+        try:
+            file[4] = _parse_layer(file[1], file[2])
+        except ParseError:
+            if verbose:
+                print('[PCB]:  Skipping file {} [ParseError]'.format(file[0]))
+
+
+# the hints can be changed at runtime, so the workers use the ones of the calling process
+def _init_parse_worker(hints):
+    layers_module.hints = hints
+
+
+# returns False if the worker processes failed, the files are then parsed one after another instead
+def _parse_layers_parallel(files, workers, verbose):
+    layers = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                                 initargs=(layers_module.hints,)) as executor:
+            futures = [executor.submit(_parse_layer, file[1], file[2]) for file in files]
+            # collected in the submit order, so the result does not depend on the order the workers finish in
+            for file, future in zip(files, futures):
+                try:
+                    layers.append(future.result())
+                except ParseError:
+                    if verbose:
+                        print('[PCB]:  Skipping file {} [ParseError]'.format(file[0]))
+                    layers.append(None)
+    except Exception as e:
+        if verbose:
+            print('[PCB]:  Parallel parsing failed [{}], parsing serially'.format(e))
+        return False
+    for file, layer in zip(files, layers):
+        file[4] = layer
+    return True
+
+
 class PCB(object):
 
     @classmethod
-    def from_directory(cls, directory, board_name=None, verbose=False):
+    def from_directory(cls, directory, board_name=None, verbose=False, cache=True, workers=1):
         layers = []
         names = set()
 
+        # cache can be a LayerCache, True for the default one, or False
+        if cache is True:
+            cache = LayerCache()
+        elif cache is False:
+            cache = None
+        stored = False
+
         # Validate
         directory = os.path.abspath(directory)
         if not os.path.isdir(directory):
             raise TypeError('{} is not a directory.'.format(directory))
 
-        # Load gerber files
+        # Read gerber files, the layers that are not cached are parsed afterwards
+        files = []
         for filename in listdir(directory, True, True):
             ext = os.path.splitext(filename)[1].lower()
             if verbose:
@@ -54,27 +114,52 @@ class PCB(object):
             try:
                 if verbose:
                     print('[PCB]: reading {}'.format(filename))
-                camfile = gerber_read(os.path.join(directory, filename))
-                if camfile is not None:
-                    layer = PCBLayer.from_cam(camfile)
-                    if verbose:
-                        print(
-                            '[PCB]:  layer {}, bounds {}, [metric units: {}]'.format(layer, layer.bounds, layer.metric))
-                    layers.append(layer)
-                    name = os.path.splitext(filename)[0]
-                    if len(os.path.splitext(filename)) > 1:
-                        _name, ext = os.path.splitext(name)
-                        if ext[1:] in layer_signatures(layer.layer_class):
-                            name = _name
-                        if layer.layer_class == 'drill' and 'drill' in ext:
-                            name = _name
-                    names.add(name)
-            except ParseError:
-                if verbose:
-                    print('[PCB]:  Skipping file {} [ParseError]'.format(filename))
+                # the data is kept, for the layer class detection
+                path = os.path.join(directory, filename)
+                with open(path, 'rU') as f:
+                    data = f.read()
             except IOError:
                 if verbose:
                     print('[PCB]:  Skipping file {} [IOError]'.format(filename))
+                continue
+            layer = None
+            key = None
+            if cache is not None:
+                key = cache.key(path, data)
+                layer = cache.load(key, path)
+                if verbose and layer is not None:
+                    print('[PCB]:  cached layer {}'.format(filename))
+            files.append([filename, path, data, key, layer])
+
+        # Parse the layers that are not cached, in worker processes if there is more than one (and more than one cpu)
+        missing = [file for file in files if file[4] is None]
+        workers = min(workers, len(missing), os.cpu_count() or 1)
+        if workers <= 1 or not _parse_layers_parallel(missing, workers, verbose):
+            _parse_layers(missing, verbose)
+        if cache is not None:
+            for filename, path, data, key, layer in missing:
+                if layer is not None:
+                    stored |= cache.store(key, layer)
+
+        # Load gerber files
+        for filename, path, data, key, layer in files:
+            if layer is None:
+                continue
+            if verbose:
+                print(
+                    '[PCB]:  layer {}, bounds {}, [metric units: {}]'.format(layer, layer.bounds, layer.metric))
+            layers.append(layer)
+            name = os.path.splitext(filename)[0]
+            if len(os.path.splitext(filename)) > 1:
+                _name, ext = os.path.splitext(name)
+                if ext[1:] in layer_signatures(layer.layer_class):
+                    name = _name
+                if layer.layer_class == 'drill' and 'drill' in ext:
+                    name = _name
+            names.add(name)
+
+        if stored:
+            cache.evict()
 
         # Try to guess board name
         if board_name is None:
@@ -17,6 +17,7 @@
 # limitations under the License.
 
 
+import copy
 import math
 from operator import add
 from itertools import combinations
@@ -187,6 +188,21 @@ class Primitive(object):
     def to_statement(self):
         pass
 
+    def flash(self, position, level_polarity='dark', units=None):
+        """ Flash this (aperture) primitive at the specified position.
+
+        Returns a shallow copy of the primitive with its own position, level
+        polarity and units, which shares the (immutable) aperture parameters
+        with this primitive, instead of deep copying them for every flash.
+        Primitives made of other primitives have to override this.
+        """
+        primitive = self.__class__.__new__(self.__class__)
+        primitive.__dict__.update(self.__dict__)
+        primitive.position = position
+        primitive.level_polarity = level_polarity
+        primitive.units = units
+        return primitive
+
     def _changed(self):
         """ Clear memoized properties.
 
@@ -1336,6 +1352,18 @@ class AMGroup(Primitive):
     def position(self):
         return self._position
 
+    def flash(self, position, level_polarity='dark', units=None):
+        """ Flash this aperture macro at the specified position.
+
+        Unlike the other primitives, the group has to be deep copied, since moving
+        it offsets its primitives in place.
+        """
+        primitive = copy.deepcopy(self)
+        primitive.position = position
+        primitive.level_polarity = level_polarity
+        primitive.units = units
+        return primitive
+
     def offset(self, x_offset=0, y_offset=0):
         self._position = tuple(map(add, self._position, (x_offset, y_offset)))
 
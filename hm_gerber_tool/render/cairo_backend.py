@@ -40,13 +40,61 @@ from io import BytesIO
 
 MIN_LINE_WIDTH = 0.75
 
+# outline segment endpoints closer than this (in both x and y) are connected
+OUTLINE_TOLERANCE = 0.01
 
+# the endpoint grid cells are larger than the tolerance, so all the endpoints connected to a point
+# are in the 3x3 cells around it, whatever the rounding
+OUTLINE_GRID_SIZE = 2.0 * OUTLINE_TOLERANCE
+
+
+# hash grid of segment endpoints, to find the connected segments without scanning all of them
+class _EndpointGrid(object):
+
+    def __init__(self):
+        self.cells = {}
+
+    @classmethod
+    def _cell(cls, point):
+        return int(math.floor(point[0] / OUTLINE_GRID_SIZE)), int(math.floor(point[1] / OUTLINE_GRID_SIZE))
+
+    def add(self, point, index):
+        self.cells.setdefault(self._cell(point), []).append((point, index))
+
+    # the lowest index of the endpoints connected to point, skipping the indexes that are not alive
+    # (the entries of those are dropped along the way), None if there is none
+    def first(self, point, alive=None):
+        found = None
+        x, y = self._cell(point)
+        for cell in ((x - 1, y - 1), (x, y - 1), (x + 1, y - 1),
+                     (x - 1, y), (x, y), (x + 1, y),
+                     (x - 1, y + 1), (x, y + 1), (x + 1, y + 1)):
+            entries = self.cells.get(cell)
+            if entries is None:
+                continue
+            if alive is not None and not all(alive[index] for _, index in entries):
+                entries[:] = [entry for entry in entries if alive[entry[1]]]
+            for endpoint, index in entries:
+                if (found is None or index < found) and GerberCairoContext._are_equal(endpoint, point):
+                    found = index
+        return found
+
+
+# the layers are recorded into SVG surfaces (and rasterized when written to a .png, or by dump_buffer),
+# unless svg is False, then they are rendered into raster (image) surfaces directly, except for the layers
+# rendered into an .svg file
+#
+# with batch, the consecutive primitives of a layer that are drawn the same way are stroked (or filled) at once
+# (see _render_batched), it is off by default until its output is verified against the per primitive rendering
 class GerberCairoContext(GerberContext):
 
-    def __init__(self, resolution=800):
+    def __init__(self, resolution=800, svg=True, batch=False):
         super(GerberCairoContext, self).__init__()
 
         self.max_size = resolution
+        self.svg = svg
+        self.use_svg = svg
+        self.batch = batch
         self.scale = None
         self.bounds = None
         self.native_origin = None
@@ -78,6 +126,23 @@ class GerberCairoContext(GerberContext):
     def scale_point(self, point):
         return tuple([coord * scale for coord, scale in zip(point, self.scale)])
 
+    @classmethod
+    def _is_svg(cls, filename):
+        try:
+            return os.path.splitext(filename.lower())[1] == '.svg'
+        except:
+            return False
+
+    def _new_surface(self, alpha_only=False):
+        """ New surface of the output size, alpha_only surfaces can only be used as masks
+        """
+        if self.use_svg:
+            return cairo.SVGSurface(None, self.pixels_size[0], self.pixels_size[1])
+        # image surfaces have whole pixels, the SVG surfaces are rounded up when rasterized as well
+        width = int(math.ceil(self.pixels_size[0]))
+        height = int(math.ceil(self.pixels_size[1]))
+        return cairo.ImageSurface(cairo.FORMAT_A8 if alpha_only else cairo.FORMAT_ARGB32, width, height)
+
     def calculate_scale(self, layer, verbose):
         if self.bounds is None:
             self.bounds = layer.bounds
@@ -136,13 +201,19 @@ class GerberCairoContext(GerberContext):
         self.has_bg = False
         self._active_matrix_base = None
 
-    def setup(self, layer, bounds=None, verbose=False):
+    def setup(self, layer, bounds=None, verbose=False, svg=False):
         if bounds is not None:
             self.bounds = bounds
         self.calculate_scale(layer, verbose)
 
-        self.output_surface_buffer = tempfile.NamedTemporaryFile()
-        self.output_surface = cairo.SVGSurface(self.output_surface_buffer, self.pixels_size[0], self.pixels_size[1])
+        self.use_svg = self.svg or svg
+        if self.use_svg:
+            self.output_surface_buffer = tempfile.NamedTemporaryFile()
+            self.output_surface = cairo.SVGSurface(self.output_surface_buffer, self.pixels_size[0],
+                                                   self.pixels_size[1])
+        else:
+            self.output_surface_buffer = None
+            self.output_surface = self._new_surface()
         self.output_surface_ctx = cairo.Context(self.output_surface)
 
     def render_layer(self, layer, filename=None, fgsettings=None, bgsettings=None, background=True, verbose=False):
@@ -158,7 +229,7 @@ class GerberCairoContext(GerberContext):
             bgsettings = THEMES['default'].get('background', RenderSettings())
 
         self.clear()
-        self.setup(layer, None, verbose)
+        self.setup(layer, None, verbose, self._is_svg(filename))
 
         if background and not self.has_bg:
             if verbose:
@@ -208,27 +279,9 @@ class GerberCairoContext(GerberContext):
 
     @classmethod
     def _are_equal(cls, p1, p2):
-        error = 0.01
+        error = OUTLINE_TOLERANCE
         return (abs(p1[0] - p2[0]) <= error) and (abs(p1[1] - p2[1]) <= error)
 
-    def _are_connected_end_start(self, one, two):
-        if one is None:
-            return False
-        elif two is None:
-            return False
-        else:
-            connected = self._are_equal(one.end, two.start)
-            return connected
-
-    def _are_backwards_connected(self, one, two):
-        if one is None:
-            return False
-        elif two is None:
-            return False
-        else:
-            connected = self._are_equal(one.end, two.end)
-            return connected
-
     @classmethod
     def _reverse_prim(cls, prim):
         prim_reversed = copy.copy(prim)
@@ -242,20 +295,20 @@ class GerberCairoContext(GerberContext):
                 arc.direction = 'counterclockwise'
         return prim_reversed
 
-    def _find_next_prim(self, remaining, last_prim):
+    # the first remaining segment (in the segments order) that starts where last_prim ends, or else the first one
+    # that ends there, reversed, the segments are found by their endpoints in the starts and ends grids
+    def _find_next_prim(self, segments, alive, starts, ends, last_prim):
         next_prim = None
         next_prim_reversed = None
-        for prim in remaining:
-            if self._are_connected_end_start(last_prim, prim):
-                next_prim = prim
-                break  # found next segment
-        if next_prim is None:
-            for prim in remaining:
-                if self._are_backwards_connected(last_prim, prim):
-                    next_prim = prim
-                    next_prim_reversed = self._reverse_prim(next_prim)
-                    break  # found backwards next segment
-        return [next_prim, next_prim_reversed]
+        index = starts.first(last_prim.end, alive)
+        if index is not None:
+            next_prim = segments[index]  # found next segment
+        else:
+            index = ends.first(last_prim.end, alive)
+            if index is not None:
+                next_prim = segments[index]
+                next_prim_reversed = self._reverse_prim(next_prim)  # found backwards next segment
+        return [index, next_prim, next_prim_reversed]
 
     @classmethod
     def _report_outline_disconnected(cls, original, chain, remaining, last_prim):
@@ -281,38 +334,58 @@ class GerberCairoContext(GerberContext):
     def _get_outline_segments(self, segments, verbose):
         _all = []
         _chain = []
-        _current_prim = segments[0]
-        _chain.append(copy.copy(_current_prim))
 
-        segments.remove(_current_prim)
-        _remaining = segments
+        # the segments are marked as not alive once they are in a chain, instead of being removed from a list
+        _alive = [True] * len(segments)
+        _remaining = len(segments)
+        _first = 0
+        _starts = _EndpointGrid()
+        _ends = _EndpointGrid()
+        for index, prim in enumerate(segments):
+            _starts.add(prim.start, index)
+            _ends.add(prim.end, index)
 
-        while len(_remaining) > 0:
-            _found_prim = None
-            _found_prim_reversed = None
+        # the endpoints of the current chain
+        _chain_ends = _EndpointGrid()
 
-            _found = self._find_next_prim(_remaining, _current_prim)
-            _found_prim = _found[0]
-            _found_prim_reversed = _found[1]
+        _current_prim = segments[0]
+        _chain.append(copy.copy(_current_prim))
+        _chain_ends.add(_current_prim.start, 0)
+        _chain_ends.add(_current_prim.end, 0)
+        _alive[0] = False
+        _remaining -= 1
+
+        while _remaining > 0:
+            _found = self._find_next_prim(segments, _alive, _starts, _ends, _current_prim)
+            _found_index = _found[0]
+            _found_prim = _found[1]
+            _found_prim_reversed = _found[2]
 
             if _found_prim is not None:
-                _remaining.remove(_found_prim)
+                _alive[_found_index] = False
+                _remaining -= 1
                 _current_prim = self._add_prim(_chain, _found_prim, _found_prim_reversed)
+                _chain_ends.add(_current_prim.start, _found_index)
+                _chain_ends.add(_current_prim.end, _found_index)
             else:
                 # did not find next primitive that connects to "remaining" chain
                 # check to see if it connect anywhere to our current chain
                 # (back to first segment perhaps?)
-                _found = self._find_next_prim(_chain, _current_prim)
-                _found_prim = _found[0]
-                _found_prim_reversed = _found[1]
-                if _found_prim is not None:
+                if _chain_ends.first(_current_prim.end) is not None:
                     _all.append(copy.copy(_chain))
                     _chain.clear()
-                    _current_prim = _remaining[0]
+                    _chain_ends = _EndpointGrid()
+                    while not _alive[_first]:
+                        _first += 1
+                    _current_prim = segments[_first]
                     _chain.append(copy.copy(_current_prim))
-                    _remaining.remove(_current_prim)
+                    _chain_ends.add(_current_prim.start, _first)
+                    _chain_ends.add(_current_prim.end, _first)
+                    _alive[_first] = False
+                    _remaining -= 1
                 else:
-                    self._report_outline_disconnected(segments, _chain, _remaining, _current_prim)
+                    _remaining_prims = [prim for prim, alive in zip(segments, _alive) if alive]
+                    self._report_outline_disconnected(_remaining_prims, _chain, _remaining_prims, _current_prim)
                     break
 
         if len(_chain) > 0:
@@ -398,7 +471,7 @@ class GerberCairoContext(GerberContext):
         self.clear()
         self.setup(layer, bounds, verbose)
 
-        self.clip_surface = self.new_render_layer(mirror=False, flip=True)
+        self.clip_surface = self.new_render_layer(mirror=False, flip=True, alpha_only=True)
         _passes = 0
         for chain in _all:
             if _passes == 0:
@@ -507,12 +580,12 @@ class GerberCairoContext(GerberContext):
     def dump(self, filename=None, verbose=False):
         """ Save image as `filename`
         """
-        try:
-            is_svg = os.path.splitext(filename.lower())[1] == '.svg'
-        except:
-            is_svg = False
+        is_svg = self._is_svg(filename)
         if verbose:
             print('[Render]: Writing image to {}'.format(filename))
+        if is_svg and self.output_surface_buffer is None:
+            print('WARNING: can not write {}, the layer was rendered without SVG [use svg=True]'.format(filename))
+            return None
         if is_svg:
             self.output_surface.finish()
             self.output_surface_buffer.flush()
@@ -530,9 +603,31 @@ class GerberCairoContext(GerberContext):
         self.output_surface.write_to_png(fobj)
         return fobj.getvalue()
 
+    def dump_buffer(self):
+        """ Return the rendered image as a (width, height, data) tuple, without encoding it.
+
+        data holds the raw cairo FORMAT_ARGB32 pixels (premultiplied BGRA on
+        little endian machines), top row first, width * 4 bytes per row.
+        A layer recorded into SVG is rasterized first.
+        """
+        surface = self.output_surface
+        if self.output_surface_buffer is not None:
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, int(math.ceil(self.pixels_size[0])),
+                                         int(math.ceil(self.pixels_size[1])))
+            ctx = cairo.Context(surface)
+            ctx.set_source_surface(self.output_surface, 0, 0)
+            ctx.paint()
+        surface.flush()
+        width = surface.get_width()
+        height = surface.get_height()
+        return width, height, bytes(surface.get_data())
+
     def dump_svg_str(self):
         """ Return a string containg the rendered SVG.
         """
+        if self.output_surface_buffer is None:
+            print('WARNING: no SVG to return, the layer was rendered without SVG [use svg=True]')
+            return None
         self.output_surface.finish()
         self.output_surface_buffer.flush()
         return self.output_surface_buffer.read()
@@ -540,8 +635,7 @@ class GerberCairoContext(GerberContext):
     def _new_mask(self):
         class Mask:
             def __enter__(msk):
-                size_in_pixels = self.size_in_pixels
-                msk.surface = cairo.SVGSurface(None, size_in_pixels[0], size_in_pixels[1])
+                msk.surface = self._new_surface(alpha_only=True)
                 msk.ctx = cairo.Context(msk.surface)
                 return msk
 
@@ -553,26 +647,97 @@ class GerberCairoContext(GerberContext):
 
     def _render_layer(self, layer, settings):
         self.invert = settings.invert
-        self.new_render_layer(mirror=settings.mirror)
-        for prim in layer.primitives:
-            #print('{}'.format(prim))
-            self.render(prim)
+        self.new_render_layer(mirror=settings.mirror, alpha_only=True)
+        if self.batch:
+            self._render_batched(layer.primitives)
+        else:
+            for prim in layer.primitives:
+                #print('{}'.format(prim))
+                self.render(prim)
         self.flatten_render_layer(settings.color, settings.alpha)
 
+    def _operator(self, prim):
+        return cairo.OPERATOR_OVER if prim.level_polarity == 'dark' and (not self.invert) else cairo.OPERATOR_CLEAR
+
+    # the batch of a primitive, the primitives of a batch are drawn with the same operator and the same
+    # line width and cap (stroke), or are filled with the same winding (fill), None if it is rendered on its own
+    def _batch_key(self, prim):
+        if isinstance(prim, Line):
+            if isinstance(prim.aperture, Circle):
+                return ('stroke', self._operator(prim)) + self._line_stroke(prim)
+        elif isinstance(prim, Arc):
+            return ('stroke', self._operator(prim)) + self._arc_stroke(prim)
+        elif isinstance(prim, Circle):
+            if ((prim.hole_diameter is None or prim.hole_diameter <= 0)
+                    and not (prim.hole_width is not None and prim.hole_height is not None
+                             and prim.hole_width > 0 and prim.hole_height > 0)):
+                return 'fill', self._operator(prim)
+        elif isinstance(prim, Rectangle):
+            if prim.hole_diameter <= 0 and not (prim.hole_width > 0 and prim.hole_height > 0):
+                return 'fill', self._operator(prim)
+        elif isinstance(prim, Drill):
+            return 'fill', self._operator(prim)
+        return None
+
+    # consecutive primitives of the same batch (see _batch_key) are added to one path, that is stroked or filled
+    # once, instead of once per primitive, the polarity order is kept since a polarity change ends a batch
+    #
+    # the circles and rectangles of a fill batch all wind the same way, so their overlaps stay filled
+    def _render_batched(self, primitives):
+        ctx = self.active_ctx
+        batch = None
+        for prim in primitives:
+            key = self._batch_key(prim) if prim else None
+            if key != batch:
+                if batch is not None:
+                    if batch[0] == 'stroke':
+                        ctx.stroke()
+                    else:
+                        ctx.fill()
+                batch = key
+                if key is not None:
+                    ctx.set_operator(key[1])
+                    if key[0] == 'stroke':
+                        ctx.set_line_width(key[2])
+                        ctx.set_line_cap(key[3])
+                    else:
+                        ctx.set_line_width(0)
+            if key is None:
+                self.render(prim)
+            elif isinstance(prim, Line):
+                self._line_path(prim)
+            elif isinstance(prim, Arc):
+                self._arc_path(prim)
+            elif isinstance(prim, Rectangle):
+                self._rectangle_path(prim)
+            else:
+                self._circle_path(prim)
+        if batch is not None:
+            if batch[0] == 'stroke':
+                ctx.stroke()
+            else:
+                ctx.fill()
+
+    # (width, cap) of a line with a circle aperture
+    def _line_stroke(self, line):
+        width = line.aperture.diameter
+        width = max(width * self.scale[0], MIN_LINE_WIDTH)
+        return width, cairo.LINE_CAP_ROUND
+
+    def _line_path(self, line):
+        self.active_ctx.move_to(*self.scale_point(line.start))
+        self.active_ctx.line_to(*self.scale_point(line.end))
+
     def _render_line(self, line, color):
-        start = self.scale_point(line.start)
-        end = self.scale_point(line.end)
         self.active_ctx.set_operator(cairo.OPERATOR_OVER
                                      if line.level_polarity == 'dark' and (not self.invert)
                                      else cairo.OPERATOR_CLEAR)
 
         if isinstance(line.aperture, Circle):
-            width = line.aperture.diameter
-            width = max(width * self.scale[0], MIN_LINE_WIDTH)
+            width, cap = self._line_stroke(line)
             self.active_ctx.set_line_width(width)
-            self.active_ctx.set_line_cap(cairo.LINE_CAP_ROUND)
-            self.active_ctx.move_to(*start)
-            self.active_ctx.line_to(*end)
+            self.active_ctx.set_line_cap(cap)
+            self._line_path(line)
             self.active_ctx.stroke()
 
         elif hasattr(line, 'vertices') and line.vertices is not None and len(line.vertices) > 1:
@@ -583,7 +748,16 @@ class GerberCairoContext(GerberContext):
                 self.active_ctx.line_to(*point)
             self.active_ctx.fill()
 
-    def _render_arc(self, arc, color):
+    # (width, cap) of an arc
+    def _arc_stroke(self, arc):
+        if isinstance(arc.aperture, Circle):
+            width = arc.aperture.diameter if arc.aperture.diameter != 0 else 0.1
+        else:
+            width = max(arc.aperture.width, arc.aperture.height, 0.1)
+        width = max(width * self.scale[0], MIN_LINE_WIDTH)
+        return width, cairo.LINE_CAP_ROUND if isinstance(arc.aperture, Circle) else cairo.LINE_CAP_SQUARE
+
+    def _arc_path(self, arc):
         center = self.scale_point(arc.center)
         start = self.scale_point(arc.start)
         end = self.scale_point(arc.end)
@@ -594,23 +768,22 @@ class GerberCairoContext(GerberContext):
         if angle1 == angle2 and arc.quadrant_mode != 'single-quadrant':
             # Make the angles slightly different otherwise Cario will draw nothing
             angle2 -= 0.000000001
-        if isinstance(arc.aperture, Circle):
-            width = arc.aperture.diameter if arc.aperture.diameter != 0 else 0.1
-        else:
-            width = max(arc.aperture.width, arc.aperture.height, 0.1)
-        width = max(width * self.scale[0], MIN_LINE_WIDTH)
-
-        self.active_ctx.set_operator(cairo.OPERATOR_OVER
-                                     if arc.level_polarity == 'dark' and (not self.invert)
-                                     else cairo.OPERATOR_CLEAR)
-        self.active_ctx.set_line_width(width)
-        self.active_ctx.set_line_cap(cairo.LINE_CAP_ROUND if isinstance(arc.aperture, Circle) else cairo.LINE_CAP_SQUARE)
         self.active_ctx.move_to(*start)  # You actually have to do this...
         if arc.direction == 'counterclockwise':
             self.active_ctx.arc(center[0], center[1], radius, angle1, angle2)
         else:
             self.active_ctx.arc_negative(center[0], center[1], radius, angle1, angle2)
         self.active_ctx.move_to(*end)  # ...lame
+
+    def _render_arc(self, arc, color):
+        width, cap = self._arc_stroke(arc)
+
+        self.active_ctx.set_operator(cairo.OPERATOR_OVER
+                                     if arc.level_polarity == 'dark' and (not self.invert)
+                                     else cairo.OPERATOR_CLEAR)
+        self.active_ctx.set_line_width(width)
+        self.active_ctx.set_line_cap(cap)
+        self._arc_path(arc)
         self.active_ctx.stroke()
 
     def _render_region(self, region, color):
@@ -635,6 +808,12 @@ class GerberCairoContext(GerberContext):
                     self.active_ctx.arc_negative(center[0], center[1], radius, angle1, angle2)
         self.active_ctx.fill()
 
+    # new_sub_path, so that the circles of a batch are not connected by lines
+    def _circle_path(self, circle):
+        center = self.scale_point(circle.position)
+        self.active_ctx.new_sub_path()
+        self.active_ctx.arc(center[0], center[1], (circle.radius * self.scale[0]), 0, (2 * math.pi))
+
     def _render_circle(self, circle, color):
         center = self.scale_point(circle.position)
         self.active_ctx.set_operator(cairo.OPERATOR_OVER
@@ -642,7 +821,7 @@ class GerberCairoContext(GerberContext):
                                      else cairo.OPERATOR_CLEAR)
 
         self.active_ctx.set_line_width(0)
-        self.active_ctx.arc(center[0], center[1], (circle.radius * self.scale[0]), 0, (2 * math.pi))
+        self._circle_path(circle)
         self.active_ctx.fill()
 
         if hasattr(circle, 'hole_diameter') and circle.hole_diameter is not None and circle.hole_diameter > 0:
@@ -667,15 +846,19 @@ class GerberCairoContext(GerberContext):
                 self.active_ctx.line_to(*point)
             self.active_ctx.fill()
 
-    def _render_rectangle(self, rectangle, color):
+    # the width and height are positive, so the rectangles wind the same way as the circles
+    def _rectangle_path(self, rectangle):
         lower_left = self.scale_point(rectangle.lower_left)
         width, height = tuple([abs(coord) for coord in self.scale_point((rectangle.width, rectangle.height))])
+        self.active_ctx.rectangle(lower_left[0], lower_left[1], width, height)
+
+    def _render_rectangle(self, rectangle, color):
         self.active_ctx.set_operator(cairo.OPERATOR_OVER
                                      if rectangle.level_polarity == 'dark' and (not self.invert)
                                      else cairo.OPERATOR_CLEAR)
 
         self.active_ctx.set_line_width(0)
-        self.active_ctx.rectangle(lower_left[0], lower_left[1], width, height)
+        self._rectangle_path(rectangle)
         self.active_ctx.fill()
 
         center = self.scale_point(rectangle.position)
@@ -831,7 +1014,7 @@ class GerberCairoContext(GerberContext):
         self.active_ctx.show_text(primitive.net_name)
         self.active_ctx.scale(1, -1)
 
-    def new_render_layer(self, mirror=False, flip=False):
+    def new_render_layer(self, mirror=False, flip=False, alpha_only=False):
         matrix = cairo.Matrix()
         matrix.x0 = self._active_matrix_base.x0
         matrix.xx = self._active_matrix_base.xx
@@ -840,7 +1023,7 @@ class GerberCairoContext(GerberContext):
         matrix.y0 = self._active_matrix_base.y0
         matrix.yx = self._active_matrix_base.yx
 
-        surface = cairo.SVGSurface(None, self.size_in_pixels[0], self.size_in_pixels[1])
+        surface = self._new_surface(alpha_only)
         ctx = cairo.Context(surface)
 
         if self.invert:
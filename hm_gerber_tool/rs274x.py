@@ -18,11 +18,11 @@
 """ This module provides an RS-274-X class and parser.
 """
 
-import copy
 import json
 import os
 import re
 import sys
+from functools import partial
 
 try:
     from cStringIO import StringIO
@@ -35,7 +35,7 @@ from .cam import CamFile, FileSettings
 from .utils import sq_distance
 
 
-def read(filename):
+def read(filename, statements_only=False):
     """ Read data from filename and return a GerberFile
 
     Parameters
@@ -43,15 +43,18 @@ def read(filename):
     filename : string
         Filename of file to parse
 
+    statements_only : bool, optional
+        Skip building the primitives while parsing, see :class:`GerberParser`
+
     Returns
     -------
     file : :class:`gerber.rs274x.GerberFile`
         A GerberFile created from the specified file.
     """
-    return GerberParser().parse(filename)
+    return GerberParser(statements_only).parse(filename)
 
 
-def loads(data, filename=None):
+def loads(data, filename=None, statements_only=False):
     """ Generate a GerberFile object from rs274x data in memory
 
     Parameters
@@ -62,12 +65,15 @@ def loads(data, filename=None):
     filename : string, optional
         string containing the filename of the data source
 
+    statements_only : bool, optional
+        Skip building the primitives while parsing, see :class:`GerberParser`
+
     Returns
     -------
     file : :class:`gerber.rs274x.GerberFile`
         A GerberFile created from the specified file.
     """
-    return GerberParser().parse_raw(data, filename)
+    return GerberParser(statements_only).parse_raw(data, filename)
 
 
 class GerberFile(CamFile):
@@ -83,6 +89,10 @@ class GerberFile(CamFile):
     settings : dict
         Dictionary of gerber file settings
 
+    primitives : list or callable
+        list of gerber file primitives, or a function returning them, which
+        is only called when the primitives are first accessed
+
     filename : string
         Filename of the source gerber file
 
@@ -101,10 +111,43 @@ class GerberFile(CamFile):
     """
 
     def __init__(self, statements, settings, primitives, apertures, filename=None):
+        # the updates (method name, arguments) applied to the primitives before they were built
+        self._primitives_updates = []
         super(GerberFile, self).__init__(statements, settings, primitives, filename)
 
         self.apertures = apertures
 
+    @property
+    def primitives(self):
+        if callable(self._primitives):
+            primitives = self._primitives()
+            for method, args in self._primitives_updates:
+                for primitive in primitives:
+                    getattr(primitive, method)(*args)
+            self._primitives = primitives
+            self._primitives_updates = []
+        return self._primitives
+
+    @primitives.setter
+    def primitives(self, primitives):
+        self._primitives = primitives
+        self._primitives_updates = []
+
+    @property
+    def has_primitives(self):
+        """ True if the primitives are built, and not only parsed on first access
+        """
+        return not callable(self._primitives)
+
+    def update_primitives(self, method, *args):
+        """ Call a method (ex. 'offset') of every primitive, or, if they are not built yet, when they are
+        """
+        if self.has_primitives:
+            for primitive in self._primitives:
+                getattr(primitive, method)(*args)
+        else:
+            self._primitives_updates.append((method, args))
+
     @property
     def comments(self):
         return [comment.comment for comment in self.statements
@@ -159,26 +202,42 @@ class GerberFile(CamFile):
             self.units = 'inch'
             for statement in self.statements:
                 statement.to_inch()
-            for primitive in self.primitives:
-                primitive.to_inch()
+            self.update_primitives('to_inch')
 
     def to_metric(self):
         if self.units != 'metric':
             self.units = 'metric'
             for statement in self.statements:
                 statement.to_metric()
-            for primitive in self.primitives:
-                primitive.to_metric()
+            self.update_primitives('to_metric')
 
     def offset(self, x_offset=0,  y_offset=0):
         for statement in self.statements:
             statement.offset(x_offset, y_offset)
-        for primitive in self.primitives:
-            primitive.offset(x_offset, y_offset)
+        self.update_primitives('offset', x_offset, y_offset)
+
+
+def _parse_primitives(data, filename):
+    return GerberParser().parse_raw(data, filename).primitives
+
+
+def _group_by_param_name(params, exprs):
+    groups = {}
+    for param, expr in zip(params, exprs):
+        name = re.match(r"\(\?P<param>(\w+)\)", param).group(1)
+        groups.setdefault(name, []).append(expr)
+    return groups
 
 
 class GerberParser(object):
     """ GerberParser
+
+    Parameters
+    ----------
+    statements_only : bool, optional
+        Only parse the statements, and skip building the primitives (lines,
+        arcs, regions and flashes). The GerberFile then parses them when they
+        are first accessed.
     """
     NUMBER = r"[\+-]?\d+"
     DECIMAL = r"[\+-]?\d+([.]?\d+)?"
@@ -215,6 +274,8 @@ class GerberParser(object):
               AD_MACRO, AM, AS, IF, IN, IP, IR, MI, OF, SF, LN)
 
     PARAM_STMT = [re.compile(r"%?{0}\*%?".format(p)) for p in PARAMS]
+    # the PARAM_STMT patterns that can match a parameter, by its name (ex. 'AD'), in the PARAM_STMT order
+    PARAM_STMT_BY_NAME = _group_by_param_name(PARAMS, PARAM_STMT)
 
     COORD_FUNCTION = r"G0?[123]"
     COORD_OP = r"D0?[123]"
@@ -234,10 +295,20 @@ class GerberParser(object):
     REGION_MODE_STMT = re.compile(r'(?P<mode>G3[67])\*')
     QUAD_MODE_STMT = re.compile(r'(?P<mode>G7[45])\*')
 
+    # the first characters that the statements can start with, so that _parse() only tries the patterns
+    # that can match a line (coordinates are tried first, and mostly match with a single pattern)
+    COORD_START = frozenset('GXYIJD')
+    APERTURE_START = frozenset('GD')
+
+    # command tokens: the command, the character that ends it, and the (skipped) newlines after it
+    COMMAND_TOKEN = re.compile(r'([^*\r\n]*)([*\r\n])[\r\n]*')
+    HEADER_TOKEN = re.compile(r'([^%\r\n]*)([%\r\n])[\r\n]*')
+
     # Keep include loop from crashing us
     INCLUDE_FILE_RECURSION_LIMIT = 10
 
-    def __init__(self):
+    def __init__(self, statements_only=False):
+        self.statements_only = statements_only
         self.filename = None
         self.settings = FileSettings()
         self.statements = []
@@ -274,39 +345,86 @@ class GerberParser(object):
         for stmt in self.statements:
             stmt.units = self.settings.units
 
-        return GerberFile(self.statements, self.settings, self.primitives, self.apertures.values(), filename)
+        primitives = partial(_parse_primitives, data, filename) if self.statements_only else self.primitives
+        return GerberFile(self.statements, self.settings, primitives, list(self.apertures.values()), filename)
 
     def _split_commands(self, data):
         """
         Split the data into commands. Commands end with * (and also newline to help with some badly formatted files)
-        """
 
+        Splits the runs of commands without any '%' with str.split(), and everything else one command
+        (or line) at a time with the COMMAND_TOKEN/HEADER_TOKEN regular expressions, yielding the same
+        commands as checking every character:
+
+        - a '%' at the start of a command starts a header, which ends with the next '%'
+        - outside of a header, commands end with '*'
+        - newlines end commands (or header lines) everywhere, empty ones are skipped
+        - anything after the last command end is ignored
+        """
         length = len(data)
         start = 0
         in_header = True
+        command_token = self.COMMAND_TOKEN.match
+        header_token = self.HEADER_TOKEN.match
 
-        for cur in range(0, length):
-
-            val = data[cur]
-
-            if val == '%' and start == cur:
+        while start < length:
+            if data[start] == '%':
                 in_header = True
-                continue
+                token = header_token(data, start + 1)
+            elif in_header:
+                token = header_token(data, start)
+            else:
+                # the commands up to the next '%' (or the end) at once
+                end = data.find('%', start)
+                if end < 0:
+                    end = length
+                last = max(data.rfind('*', start, end), data.rfind('\n', start, end), data.rfind('\r', start, end))
+                if last >= start:
+                    yield from self._split_command_run(data, start, last + 1)
+                    start = last + 1
+                    if start == end:
+                        continue
+                token = command_token(data, start)
+            if token is None:
+                return
+
+            val = token.group(2)
 
             if val == '\r' or val == '\n':
+                cur = token.start(2)
                 if start != cur:
                     yield data[start:cur]
-                start = cur + 1
 
-            elif not in_header and val == '*':
-                yield data[start:cur + 1]
-                start = cur + 1
-
-            elif in_header and val == '%':
-                yield data[start:cur + 1]
-                start = cur + 1
+            elif val == '%':
+                yield data[start:token.end(2)]
                 in_header = False
 
+            else:
+                yield data[start:token.end(2)]
+
+            start = token.end()
+
+    @staticmethod
+    def _split_command_run(data, start, end):
+        """
+        Split data[start:end], which has no '%' and ends with '*' or a newline, into commands
+        """
+        run = data[start:end]
+        if '\r' in run:
+            run = run.replace('\r', '\n')
+        for line in run.split('\n'):
+            if not line:
+                continue
+            if line.find('*') == len(line) - 1:
+                # the common case, one command per line
+                yield line
+            else:
+                *commands, rest = line.split('*')
+                for command in commands:
+                    yield command + '*'
+                if rest:
+                    yield rest
+
     def dump_json(self):
         stmts = {"statements": [stmt.__dict__ for stmt in self.statements]}
         return json.dumps(stmts)
@@ -342,8 +460,10 @@ class GerberParser(object):
                     did_something = True
                     continue
 
+                first = line[0]
+
                 # coord
-                (coord, r) = _match_one(self.COORD_STMT, line)
+                (coord, r) = _match_one(self.COORD_STMT, line) if first in self.COORD_START else ({}, None)
                 if coord:
                     yield CoordStmt.from_dict(coord, self.settings)
                     line = r
@@ -351,7 +471,7 @@ class GerberParser(object):
                     continue
 
                 # aperture selection
-                (aperture, r) = _match_one(self.APERTURE_STMT, line)
+                (aperture, r) = _match_one(self.APERTURE_STMT, line) if first in self.APERTURE_START else ({}, None)
                 if aperture:
                     yield ApertureStmt(**aperture)
                     did_something = True
@@ -359,7 +479,9 @@ class GerberParser(object):
                     continue
 
                 # parameter
-                (param, r) = _match_one_from_many(self.PARAM_STMT, line)
+                name = line[1:3] if first == '%' else line[0:2]
+                param_stmts = self.PARAM_STMT_BY_NAME.get(name)
+                (param, r) = _match_one_from_many(param_stmts, line) if param_stmts else ({}, None)
 
                 if param:
                     if param["param"] == "FS":
@@ -421,50 +543,52 @@ class GerberParser(object):
                     line = r
                     continue
 
-                # Region Mode
-                (mode, r) = _match_one(self.REGION_MODE_STMT, line)
-                if mode:
-                    yield RegionModeStmt.from_gerber(line)
-                    line = r
-                    did_something = True
-                    continue
-
-                # Quadrant Mode
-                (mode, r) = _match_one(self.QUAD_MODE_STMT, line)
-                if mode:
-                    yield QuadrantModeStmt.from_gerber(line)
-                    line = r
-                    did_something = True
-                    continue
-
-                # comment
-                (comment, r) = _match_one(self.COMMENT_STMT, line)
-                if comment:
-                    yield CommentStmt(comment["comment"])
-                    did_something = True
-                    line = r
-                    continue
-
-                # deprecated codes
-                (deprecated_unit, r) = _match_one(self.DEPRECATED_UNIT, line)
-                if deprecated_unit:
-                    stmt = MOParamStmt(param="MO", mo="inch" if "G70" in
-                                       deprecated_unit["mode"] else "metric")
-                    self.settings.units = stmt.mode
-                    yield stmt
-                    line = r
-                    did_something = True
-                    continue
+                # the G code statements (other than coord)
+                if first == 'G':
+                    # Region Mode
+                    (mode, r) = _match_one(self.REGION_MODE_STMT, line)
+                    if mode:
+                        yield RegionModeStmt.from_gerber(line)
+                        line = r
+                        did_something = True
+                        continue
+
+                    # Quadrant Mode
+                    (mode, r) = _match_one(self.QUAD_MODE_STMT, line)
+                    if mode:
+                        yield QuadrantModeStmt.from_gerber(line)
+                        line = r
+                        did_something = True
+                        continue
+
+                    # comment
+                    (comment, r) = _match_one(self.COMMENT_STMT, line)
+                    if comment:
+                        yield CommentStmt(comment["comment"])
+                        did_something = True
+                        line = r
+                        continue
+
+                    # deprecated codes
+                    (deprecated_unit, r) = _match_one(self.DEPRECATED_UNIT, line)
+                    if deprecated_unit:
+                        stmt = MOParamStmt(param="MO", mo="inch" if "G70" in
+                                           deprecated_unit["mode"] else "metric")
+                        self.settings.units = stmt.mode
+                        yield stmt
+                        line = r
+                        did_something = True
+                        continue
 
-                (deprecated_format, r) = _match_one(self.DEPRECATED_FORMAT, line)
-                if deprecated_format:
-                    yield DeprecatedStmt.from_gerber(line)
-                    line = r
-                    did_something = True
-                    continue
+                    (deprecated_format, r) = _match_one(self.DEPRECATED_FORMAT, line)
+                    if deprecated_format:
+                        yield DeprecatedStmt.from_gerber(line)
+                        line = r
+                        did_something = True
+                        continue
 
                 # eof
-                (eof, r) = _match_one(self.EOF_STMT, line)
+                (eof, r) = _match_one(self.EOF_STMT, line) if first == 'M' else ({}, None)
                 if eof:
                     yield EofStmt()
                     did_something = True
@@ -638,6 +762,10 @@ class GerberParser(object):
             # no implicit op allowed, force here if coord block doesn't have it
             stmt.op = self.op
 
+        if self.statements_only:
+            self.x, self.y = x, y
+            return
+
         if self.op == "D01" or self.op == "D1":
             start = (self.x, self.y)
             end = (x, y)
@@ -705,17 +833,14 @@ class GerberParser(object):
                 self.current_region = None
 
         elif self.op == "D03" or self.op == "D3":
-            primitive = copy.deepcopy(self.apertures[self.aperture])
+            primitive = self.apertures[self.aperture]
 
             if primitive is not None:
 
                 if not isinstance(primitive, AMParamStmt):
-                    primitive.position = (x, y)
-                    primitive.level_polarity = self.level_polarity
-                    primitive.units = self.settings.units
-                    self.primitives.append(primitive)
+                    self.primitives.append(primitive.flash((x, y), self.level_polarity, self.settings.units))
                 else:
-                    # Aperture Macro
+                    # Aperture Macro (to_primitive() creates new primitives, no need to copy the macro)
                     for am_prim in primitive.primitives:
                         renderable = am_prim.to_primitive((x, y), self.level_polarity, self.settings.units)
                         if renderable is not None:
@@ -24,10 +24,28 @@ files.
 """
 
 import os
+import re
+from functools import lru_cache
 from math import radians, sin, cos, sqrt, atan2, pi
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 MILLIMETERS_PER_INCH = 25.4
 
+# Maximum number of values memoized by parse_gerber_value / write_gerber_value.
+# Gerber coordinates are snapped to a grid, so the same values repeat a lot.
+GERBER_VALUE_CACHE_SIZE = 65536
+
+# Number of characters detect_file_format scans for a format marker (rounded up to a whole line).
+# The markers are in the headers, so the rest of the file is never looked at.
+FILE_FORMAT_HEADER_SIZE = 64 * 1024
+
+# Any of the format markers, the line it is found in decides the format
+FILE_FORMAT_MARKERS = re.compile(r'M48|%FS|^[^\S\n]*P[^\S\n]+JOB(?!\S)', re.MULTILINE)
+
 
 def parse_gerber_value(value, format=(4, 6), zero_suppression='trailing'):
     """ Convert gerber/excellon formatted string to floating-point number
@@ -60,6 +78,11 @@ def parse_gerber_value(value, format=(4, 6), zero_suppression='trailing'):
         The specified value as a floating-point number.
 
     """
+    return _parse_gerber_value(value, tuple(format), zero_suppression)
+
+
+@lru_cache(maxsize=GERBER_VALUE_CACHE_SIZE)
+def _parse_gerber_value(value, format, zero_suppression):
     # Handle excellon edge case with explicit decimal. "That was easy!"
     if '.' in value:
         return float(value)
@@ -83,14 +106,20 @@ def parse_gerber_value(value, format=(4, 6), zero_suppression='trailing'):
     missing_digits = MAX_DIGITS - len(value)
 
     if zero_suppression == 'trailing':
-        digits = list(value + ('0' * missing_digits))
+        digits = value + ('0' * missing_digits)
     elif zero_suppression == 'leading':
-        digits = list(('0' * missing_digits) + value)
+        digits = ('0' * missing_digits) + value
     else:
-        digits = list(value)
-
-    result = float(
-        ''.join(digits[:integer_digits] + ['.'] + digits[integer_digits:]))
+        digits = value
+
+    # The digits are an integer scaled by 10**decimals. Integer true division
+    # is correctly rounded, so this gives the same float as parsing the digits
+    # with the decimal point put back in.
+    decimals = len(digits) - integer_digits
+    if decimals > 0:
+        result = int(digits) / (10 ** decimals)
+    else:
+        result = float(int(digits))
     return -result if negative else result
 
 
@@ -160,6 +189,11 @@ def write_gerber_value(value, format=(4, 6), zero_suppression='trailing', zeros=
                 print('  AFTER STRIP {}'.format(string))
         return string
 
+    return _write_gerber_value(value, tuple(format), zero_suppression)
+
+
+@lru_cache(maxsize=GERBER_VALUE_CACHE_SIZE)
+def _write_gerber_value(value, format, zero_suppression):
     # Format precision
     integer_digits, decimal_digits = format
     MAX_DIGITS = integer_digits + decimal_digits
@@ -176,27 +210,117 @@ def write_gerber_value(value, format=(4, 6), zero_suppression='trailing', zeros=
     if negative:
         value = -1.0 * value
 
-    # Format string for padding out in both directions
-    fmtstring = '%%0%d.0%df' % (MAX_DIGITS + 1, decimal_digits)
-    digits = [val for val in fmtstring % value if val != '.']
-
-    # If all the digits are 0, return '0'.
-    digit_sum = sum([int(digit) for digit in digits])
-    if digit_sum == 0:
-        return '0'
+    # Pad out in both directions, then drop the decimal point
+    digits = ('%0*.*f' % (MAX_DIGITS + 1, decimal_digits, value)).replace('.', '')
+    if not digits.isdigit():
+        raise ValueError('Can not write {} as a Gerber value'.format(value))
 
     # Suppression...
     if zero_suppression == 'trailing':
-        while digits and digits[-1] == '0':
-            digits.pop()
+        digits = digits.rstrip('0')
     elif zero_suppression == 'leading':
-        while digits and digits[0] == '0':
-            digits.pop(0)
+        digits = digits.lstrip('0')
+    elif not digits.strip('0'):
+        digits = ''
 
+    # If all the digits are 0, return '0'.
     if not digits:
         return '0'
 
-    return ''.join(digits) if not negative else ''.join(['-'] + digits)
+    return digits if not negative else '-' + digits
+
+
+def write_gerber_values(values, format=(4, 6), zero_suppression='trailing', zeros=None):
+    """ Convert a batch of floating point numbers to Gerber/Excellon-formatted strings.
+
+    This is the preferred way to write whole coordinate columns: with numpy the
+    values are scaled and rounded to integers in one vectorized pass, and every
+    distinct integer is turned into a string only once. `None` values are
+    passed through.
+
+    Parameters
+    ----------
+    values : iterable of float
+        The floating point values.
+
+    format :  tuple (n=2)
+        Gerber/Excellon precision format, see `write_gerber_value`
+
+    zero_suppression : string
+        Zero-suppression mode. May be 'leading', 'trailing' or 'none'
+
+    zeros: string
+        Unless 'decimal' it should be the opposite of zero_suppression
+        If 'decimal' format using %f
+
+    Returns
+    -------
+    values : list of string
+        The specified values as Gerber/Excellon-formatted strings.
+    """
+    if format[0] == float:
+        # '%f' tells -0.0 and 0.0 apart, the lookups below do not
+        return [None if value is None else write_gerber_value(value, format, zero_suppression, zeros)
+                for value in values]
+    if numpy is not None and (zeros is None or zeros != 'decimal'):
+        return _write_gerber_values_vectorized(values, tuple(format), zero_suppression)
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+    written = {None: None}
+    result = []
+    append = result.append
+    for value in values:
+        string = written.get(value)
+        if string is None and value is not None:
+            string = write_gerber_value(value, format, zero_suppression, zeros)
+            written[value] = string
+        append(string)
+    return result
+
+
+def _write_gerber_values_vectorized(values, format, zero_suppression):
+    integer_digits, decimal_digits = format
+    max_digits = integer_digits + decimal_digits
+    if max_digits > 13 or integer_digits > 6 or decimal_digits > 7:
+        raise ValueError('Parser only supports precision up to 6:7 format')
+
+    if not isinstance(values, numpy.ndarray):
+        values = list(values)
+        if None in values:
+            present = [value is not None for value in values]
+            written = iter(_write_gerber_values_vectorized([value for value in values if value is not None],
+                                                           format, zero_suppression))
+            return [next(written) if is_present else None for is_present in present]
+    values = numpy.asarray(values, dtype=numpy.float64)
+
+    # '%f' rounds the exact binary value, while the scaled value is off by up to half an ulp,
+    # so the values that are (almost) halfway between two integers, and the ones that are too
+    # large to be rounded exactly (or not finite), are written one at a time by _write_gerber_value
+    with numpy.errstate(invalid='ignore'):
+        scaled = values * (10.0 ** decimal_digits)
+        rounded = numpy.rint(scaled)
+        margin = numpy.abs(scaled) * 1e-15 + 1e-12
+        exact = (numpy.abs(numpy.abs(scaled - rounded) - 0.5) > margin) & (numpy.abs(rounded) < 2.0 ** 53)
+    integers = numpy.where(exact, rounded, 0.0).astype(numpy.int64)
+
+    # every distinct integer is written once
+    unique, inverse = numpy.unique(integers, return_inverse=True)
+    strings = []
+    for integer in unique.tolist():
+        if integer == 0:
+            strings.append('0')
+            continue
+        digits = str(abs(integer)).zfill(max_digits)
+        if zero_suppression == 'trailing':
+            digits = digits.rstrip('0')
+        elif zero_suppression == 'leading':
+            digits = digits.lstrip('0')
+        strings.append(digits if integer > 0 else '-' + digits)
+    result = numpy.array(strings, dtype=object)[inverse.reshape(-1)].tolist()
+
+    for index in numpy.flatnonzero(~exact).tolist():
+        result[index] = _write_gerber_value(float(values[index]), format, zero_suppression)
+    return result
 
 
 def decimal_string(value, precision=6, padding=False):
@@ -237,7 +361,7 @@ def decimal_string(value, precision=6, padding=False):
         return int(floatstr)
 
 
-def detect_file_format(data):
+def detect_file_format(data, header_size=FILE_FORMAT_HEADER_SIZE):
     """ Determine format of a file
 
     Parameters
@@ -245,21 +369,53 @@ def detect_file_format(data):
     data : string
         string containing file data.
 
+    header_size : int
+        Number of characters scanned for a format marker, rounded up to a
+        whole line. None scans the whole file.
+
     Returns
     -------
     format : string
-        File format. 'excellon' or 'rs274x' or 'unknown'
+        File format. 'excellon' or 'rs274x' or 'ipc_d_356' or 'unknown'
+    """
+    end = len(data)
+    if header_size is not None and header_size < end:
+        end = data.find('\n', header_size)
+        if end < 0:
+            end = len(data)
+    match = FILE_FORMAT_MARKERS.search(data, 0, end)
+    if match is None:
+        return 'unknown'
+    # the markers are checked in this order within the first line that has any of them
+    start = data.rfind('\n', 0, match.start()) + 1
+    line_end = data.find('\n', match.start())
+    line = data[start:line_end if line_end >= 0 else len(data)]
+    if 'M48' in line:
+        return 'excellon'
+    elif '%FS' in line:
+        return 'rs274x'
+    return 'ipc_d_356'
+
+
+def read_file_format(filename, header_size=FILE_FORMAT_HEADER_SIZE):
+    """ Read a file and determine its format
+
+    Parameters
+    ----------
+    filename : string
+        Filename of the file to read.
+
+    header_size : int
+        See detect_file_format
+
+    Returns
+    -------
+    format, data : (string, string)
+        File format, as returned by detect_file_format, and the file data.
     """
-    lines = data.split('\n')
-    for line in lines:
-        if 'M48' in line:
-            return 'excellon'
-        elif '%FS' in line:
-            return 'rs274x'
-        elif ((len(line.split()) >= 2) and
-              (line.split()[0] == 'P') and (line.split()[1] == 'JOB')):
-            return 'ipc_d_356'
-    return 'unknown'
+    with open(filename, 'rU') as f:
+        data = f.read()
+    return detect_file_format(data, header_size), data
 
 
 def validate_coordinates(position):
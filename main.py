@@ -177,7 +177,7 @@ class PanelizerApp(App):
             self._current_pcb_folder = demo_real_pcb
             #self.load(demo_real_pcb, [])
 
-    def load_pcb(self, path, name):
+    def load_pcb(self, path, name, rasters=None, outline=None):
         self.root.ids._panelization_button.state = 'normal'
         self.rotate(True)
 
@@ -188,7 +188,7 @@ class PanelizerApp(App):
             self._pcb_panel.deactivate()
             self._pcb_panel = None
 
-        self._pcb = Pcb(self.root.ids, path, name)
+        self._pcb = Pcb(self.root.ids, path, name, rasters, outline)
         if self._pcb.valid:
             self._pixels_per_cm = self._pcb.pixels_per_cm
             self._pcb_board = PcbBoard(root=self._surface, pcb=self._pcb)
@@ -423,8 +423,10 @@ class PanelizerApp(App):
             except FileExistsError:
                 pass
             self._current_pcb_folder = path
-            generate_pcb_data_layers(path, '.', temp_dir, self._progress, filename_only)
-            error_msg = self.load_pcb(temp_dir, filename_only)
+            rasters, outline = generate_pcb_data_layers(path, '.', temp_dir, self._progress, filename_only)
+            if not PCB_LOAD_LAYER_RASTERS:
+                rasters = None
+            error_msg = self.load_pcb(temp_dir, filename_only, rasters, outline)
             #print('marking temporary directory for deletion {}', temp_dir)
             self._tmp_folders_to_delete.append(temp_dir)
 
@@ -509,7 +511,8 @@ class PanelizerApp(App):
                                      self._current_pcb_folder, pcb_origins, pcb_rect_mm,
                                      rail_path, rail_origins,
                                      mouse_bite_path, mouse_bite_origins, AppSettings.bite, AppSettings.gap,
-                                     self._angle)
+                                     self._angle, workers=PCB_PANEL_EXPORT_WORKERS,
+                                     step_repeat=AppSettings.use_step_repeat)
         if error_msg is not None:
             self.error_open(error_msg)
 
@@ -586,6 +589,7 @@ class PanelizerApp(App):
         self._settings_popup.ids._bite_hole_space_setting.text = '{:0.3f}'.format(AppSettings.bite_hole_space)
         self._settings_popup.ids._use_vcut_setting.state = 'down' if AppSettings.use_vcut else 'normal'
         self._settings_popup.ids._use_jlc_setting.state = 'down' if AppSettings.use_jlc else 'normal'
+        self._settings_popup.ids._use_step_repeat_setting.state = 'down' if AppSettings.use_step_repeat else 'normal'
         self._settings_popup.ids._merge_error_setting.text = '{:0.3f}'.format(AppSettings.merge_error)
 
     def settings_open(self):
@@ -625,11 +629,13 @@ class PanelizerApp(App):
             bite_hole_space = AppSettings.bite_hole_space
         use_vcut = True if self._settings_popup.ids._use_vcut_setting.state == 'down' else False
         use_jlc = True if self._settings_popup.ids._use_jlc_setting.state == 'down' else False
+        use_step_repeat = True if self._settings_popup.ids._use_step_repeat_setting.state == 'down' else False
         try:
             merge_error = float(self._settings_popup.ids._merge_error_setting.text)
         except:
             merge_error = AppSettings.merge_error
-        AppSettings.set(gap, rail, self._bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error)
+        AppSettings.set(gap, rail, self._bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error,
+                        use_step_repeat)
 
         PcbRail.invalidate()
         PcbMouseBites.invalidate()
@@ -647,7 +653,9 @@ class PanelizerApp(App):
         use_vcut = Constants.OSHPARK_PCB_PANEL_VCUT
         use_jlc = False
         merge_error = AppSettings.merge_error
-        AppSettings.set(gap, rail, self._bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error)
+        use_step_repeat = Constants.OSHPARK_PCB_PANEL_STEP_REPEAT
+        AppSettings.set(gap, rail, self._bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error,
+                        use_step_repeat)
         self.settings_apply()
 
     def settings_jlcpcb(self):
@@ -659,7 +667,9 @@ class PanelizerApp(App):
         use_vcut = Constants.JLC_PCB_PANEL_VCUT
         use_jlc = True
         merge_error = AppSettings.merge_error
-        AppSettings.set(gap, rail, self._bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error)
+        use_step_repeat = Constants.JLC_PCB_PANEL_STEP_REPEAT
+        AppSettings.set(gap, rail, self._bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error,
+                        use_step_repeat)
         self.settings_apply()
 
     def settings_pcbway(self):
@@ -671,7 +681,9 @@ class PanelizerApp(App):
         use_vcut = Constants.PCBWAY_PCB_PANEL_VCUT
         use_jlc = False
         merge_error = AppSettings.merge_error
-        AppSettings.set(gap, rail, self._bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error)
+        use_step_repeat = Constants.PCBWAY_PCB_PANEL_STEP_REPEAT
+        AppSettings.set(gap, rail, self._bites_count, bite, bite_hole_radius, bite_hole_space, use_vcut, use_jlc, merge_error,
+                        use_step_repeat)
         self.settings_apply()
 
     def about(self):